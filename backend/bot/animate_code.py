@@ -1,9 +1,14 @@
 # Финальная, исправленная версия animate_code.py
+import logging
 import os
 from pathlib import Path
 from manim import *
-import glob
-from typing import List
+from text_measure import wrap_text
+from scene_layout import get_layout, render_caption_layer
+from highlight import DEFAULT_LANGUAGE
+from render_pool import MANIM_TEXT_DIR
+
+logger = logging.getLogger(__name__)
 
 # --- ШАГ 1: ГЛОБАЛЬНАЯ НАСТРОЙКА (выполняется при импорте файла) ---
 # Читаем разрешение из переменной окружения, которую задает bot.py
@@ -17,28 +22,26 @@ config.frame_rate = 30
 # Указываем, чтобы Manim не добавлял свои флаги к имени файла, т.к. мы задаем его точно
 # config.output_file = Path(os.environ.get("OUTPUT_FILE", "video_only.mp4")).stem
 
+# Длительность появления одной страницы кода и пауза, чтобы ее дочитать, перед следующей
+PAGE_WRITE_SECONDS = 5
+PAGE_HOLD_SECONDS = 3
+PAGE_FADE_SECONDS = 0.5
+
 def split_text_to_fit(text: str, max_width: float, font: str = "Arial", weight=BOLD) -> str:
-    words = text.split()
-    lines: List[str] = []
-    current_line = ""
-    for word in words:
-        test_line = (current_line + " " + word).strip()
-        test_mob = Text(test_line, font=font, weight=weight)
-        if test_mob.width <= max_width or not current_line:
-            current_line = test_line
-        else:
-            lines.append(current_line)
-            current_line = word
-    if current_line:
-        lines.append(current_line)
-    return "\n".join(lines)
+    # Перенос по кэшированным ширинам слов, см. text_measure
+    return wrap_text(text, max_width, font=font, weight=weight)
 
 class CodeScene(Scene):
-    def __init__(self, **kwargs):
-        # Получаем остальные данные из переменных окружения
-        self.code_str = os.environ.get("CODE_TEXT", "")
-        self.top_text = os.environ.get("TOP_TEXT", "")
-        self.bottom_text = os.environ.get("BOTTOM_TEXT", "")
+    def __init__(self, code_str=None, top_text=None, bottom_text=None, audio_duration=None,
+                 caption_layer_path="", language=DEFAULT_LANGUAGE, tokens=None, **kwargs):
+        # Данные передаются явно (пул рендереров) или берутся из переменных окружения (запуск через `manim`)
+        self.code_str = code_str if code_str is not None else os.environ.get("CODE_TEXT", "")
+        self.top_text = top_text if top_text is not None else os.environ.get("TOP_TEXT", "")
+        self.bottom_text = bottom_text if bottom_text is not None else os.environ.get("BOTTOM_TEXT", "")
+        self.audio_duration = audio_duration if audio_duration is not None else float(os.environ.get("AUDIO_DURATION", "7"))
+        self.caption_layer_path = caption_layer_path
+        self.language = language
+        self.tokens = tokens  # готовая подсветка из конвейера; без нее код разбирается при сборке раскладки
         super().__init__(**kwargs)
 
     def construct(self):
@@ -49,63 +52,73 @@ class CodeScene(Scene):
             self.camera.frame_width = 9
             self.camera.frame_height = 16
         
-        # --- ШАГ 3: ЛОГИКА РЕНДЕРИНГА (без изменений) ---
-        if self.top_text:
-            top_text_wrapped = split_text_to_fit(self.top_text, self.camera.frame_width * 0.95, font="Arial", weight=BOLD)
-            top_text_mob = Text(top_text_wrapped, font="Arial", weight=BOLD)
-            top_text_mob.scale_to_fit_width(self.camera.frame_width * 0.95)
-            max_top_height = self.camera.frame_height * 0.15
-            if top_text_mob.height > max_top_height:
-                top_text_mob.scale_to_fit_height(max_top_height)
-            # Центрируем по X, прижимаем к верху с небольшим отступом
-            top_text_mob.move_to([0, self.camera.frame_height/2 - top_text_mob.height/2 - 0.2, 0])
-            self.add(top_text_mob)
+        # --- ШАГ 3: ЛОГИКА РЕНДЕРИНГА ---
+        # Раскладка (подсветка, подписи, подгонка масштаба) берется из кэша, см. scene_layout
+        layout = get_layout(
+            self.code_str, self.language, self.top_text, self.bottom_text,
+            self.camera.frame_width, self.camera.frame_height, tokens=self.tokens,
+        )
+        if self.caption_layer_path:
+            # Подписи статичны: растеризуем их один раз, а в кадр их наложит ffmpeg
+            render_caption_layer(
+                layout, self.top_text, self.bottom_text, self.camera.frame_width, self.camera.frame_height,
+                (config.pixel_width, config.pixel_height), Path(self.caption_layer_path),
+            )
         else:
-            top_text_mob = Text("", font="Arial", weight=BOLD)
+            for caption in (layout.top, layout.bottom):
+                if caption:
+                    self.add(caption)
 
-        if self.bottom_text:
-            bottom_text_wrapped = split_text_to_fit(self.bottom_text, self.camera.frame_width * 0.95, font="Arial")
-            bottom_text_mob = Text(bottom_text_wrapped, font="Arial").scale(0.8)
-            bottom_text_mob.scale_to_fit_width(self.camera.frame_width * 0.95)
-            max_bottom_height = self.camera.frame_height * 0.15
-            if bottom_text_mob.height > max_bottom_height:
-                bottom_text_mob.scale_to_fit_height(max_bottom_height)
-            # Центрируем по X, прижимаем к низу с небольшим отступом
-            bottom_text_mob.move_to([0, -self.camera.frame_height/2 + bottom_text_mob.height/2 + 0.2, 0])
-            self.add(bottom_text_mob)
-        else:
-            bottom_text_mob = Text("", font="Arial").scale(0.8)
-        
-        # Определяем доступное пространство для кода между надписями
-        code_top_y = top_text_mob.get_bottom()[1] - 0.5 if self.top_text else self.camera.frame_height / 2 - 0.5
-        code_bottom_y = bottom_text_mob.get_top()[1] + 0.5 if self.bottom_text else -self.camera.frame_height / 2 + 0.5
-        available_height = code_top_y - code_bottom_y
-        available_width = self.camera.frame_width * 0.9
+        # Длинный код идет по страницам: каждая — отдельная анимация Write, предыдущая уходит
+        first_page, *next_pages = layout.pages
+        self.play(Write(VGroup(layout.background, first_page)), run_time=PAGE_WRITE_SECONDS)
+        animation_time = PAGE_WRITE_SECONDS
+        previous = first_page
+        for page in next_pages:
+            self.wait(PAGE_HOLD_SECONDS)
+            self.play(FadeOut(previous), run_time=PAGE_FADE_SECONDS)
+            self.play(Write(page), run_time=PAGE_WRITE_SECONDS)
+            animation_time += PAGE_HOLD_SECONDS + PAGE_FADE_SECONDS + PAGE_WRITE_SECONDS
+            previous = page
+        # Статичный хвост под длину озвучки; при рендере из пула он добавляется в ffmpeg
+        hold_time = self.audio_duration - animation_time
+        if hold_time > 0:
+            self.wait(hold_time)
+        logger.debug(f"Итоговое видео Manim: {self.renderer.file_writer.movie_file_path}")
 
-        # Создаем объект кода
-        code = Code(
-            code_string=self.code_str,
-            language="python"
-        )
-        
-        # Масштабируем код, чтобы он поместился в доступное пространство
-        if code.width > available_width:
-            code.scale_to_fit_width(available_width)
-        if code.height > available_height:
-            code.scale_to_fit_height(available_height)
-            
-        # Центрируем код в доступном пространстве
-        center_point = np.array([0, code_bottom_y + available_height / 2, 0])
-        code.move_to(center_point)
+# Кэш SVG для Text/Tex общий для всех заданий одного рендерера: файлы в нем именуются по хэшу
+# содержимого. Manim пишет SVG не атомарно, поэтому у каждого процесса-рендерера своя папка,
+# иначе параллельный рендер той же подписи мог бы прочитать недописанный файл
+# (папки удаляет пул: при выходе воркера и при старте, если воркер упал, см. render_pool)
+def worker_text_dir() -> str:
+    return os.path.join(MANIM_TEXT_DIR, f"worker-{os.getpid()}")
 
-        animation_time = 5
-        audio_duration = float(os.environ.get("AUDIO_DURATION", "7"))
-        self.play(Write(code), run_time=animation_time)
-        self.wait(max(0, audio_duration - animation_time))
-        # [MANIM DEBUG] Выводим путь итогового видео
-        print(f"[MANIM DEBUG] Итоговое видео: {self.renderer.file_writer.movie_file_path}")
+def render_code_scene(code_text: str, top_text: str, bottom_text: str, resolution: tuple, frame_rate: int,
+                      media_dir: str, output_name: str, caption_layer_path: str = "",
+                      language: str = DEFAULT_LANGUAGE, tokens: list = None) -> str:
+    """Рендерит только анимацию CodeScene (без статичного хвоста) и возвращает путь к mp4.
 
-# Функция main() и argparse полностью удалены, так как они не нужны и создавали проблемы.
+    Длительность озвучки здесь не нужна, поэтому рендер идет параллельно с TTS.
+    Все файлы задания (включая partial_movie_files) пишутся в собственный media_dir,
+    поэтому параллельные рендеры не пересекаются. Если задан caption_layer_path,
+    подписи не рисуются в кадре, а сохраняются туда прозрачным PNG (при их наличии).
+    tokens — подсветка кода, заранее посчитанная конвейером (см. highlight).
+    """
+    pixel_width, pixel_height = resolution
+    with tempconfig({
+        "pixel_width": pixel_width,
+        "pixel_height": pixel_height,
+        "frame_rate": frame_rate,
+        "disable_caching": True,
+        "media_dir": media_dir,
+        "text_dir": worker_text_dir(),
+        "output_file": output_name,
+    }):
+        scene = CodeScene(
+            code_str=code_text, top_text=top_text, bottom_text=bottom_text, audio_duration=0,
+            caption_layer_path=caption_layer_path, language=language, tokens=tokens,
+        )
+        scene.render()
+        return str(scene.renderer.file_writer.movie_file_path)
 
-for f in glob.glob("media/videos/animate_code/**/*.mp4", recursive=True):
-    print(f"[MANIM DEBUG] Найден mp4: {f}")
\ No newline at end of file
+# Функция main() и argparse полностью удалены, так как они не нужны и создавали проблемы.
@@ -0,0 +1,188 @@
+# batch.py
+"""Пакетный режим: много роликов из одного сообщения, файла или JSONL за один запуск.
+
+Все элементы идут через тот же конвейер, что и одиночные видео: общий пул прогретых
+рендереров, один клиент OpenAI и общий кэш артефактов. Результаты отдаются по мере
+готовности, а не после завершения всей пачки.
+
+Запуск из командной строки:
+    python batch.py items.jsonl --format 9:16 --profile standard --out static/batch
+Каждая строка JSONL — либо {"text": "<сообщение как в боте>"}, либо готовые поля
+tts_text, code_text, top_text, bottom_text и, по желанию, language (тег языка кода).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from contextlib import aclosing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from content_parser import parse_user_input, is_complete
+from highlight import DEFAULT_LANGUAGE, resolve_language
+from render_queue import RENDER_CONCURRENCY, RENDER_QUEUE_SIZE, QueueFullError, RenderScheduler
+from render_profiles import PROFILES
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+# Сколько элементов пачки одновременно стоят в общей очереди рендера; больше, чем в нее помещается, нет смысла
+BATCH_CONCURRENCY = min(int(os.getenv("BATCH_CONCURRENCY", "0")) or RENDER_CONCURRENCY, RENDER_QUEUE_SIZE)
+# Пауза между попытками встать в заполненную очередь растет до этого предела (секунды)
+BATCH_RETRY_MAX_SECONDS = 5
+
+# Явный разделитель элементов — строка из трех и более знаков "="
+_SEPARATOR = re.compile(r'^[ \t]*={3,}[ \t]*$', re.MULTILINE)
+_CODE_BLOCK = re.compile(r'\/\/\/[a-zA-Z]*\n?[\s\S]*?\/\/\/')
+
+# Генерация одного элемента: (номер, содержимое) -> путь к готовому видео
+ItemRenderer = Callable[[int, dict], Awaitable[Path]]
+
+
+@dataclass
+class BatchResult:
+    index: int  # номер элемента в пачке, с единицы
+    content: dict
+    video_path: Optional[Path] = None
+    error: Optional[Exception] = None
+
+
+def split_batch_text(text: str) -> List[str]:
+    """Делит текст на сообщения: по строкам "===", а без них — по одному на каждый блок ///код///.
+
+    Без разделителей текст до блока кода (и надписи в нем) относится к этому блоку,
+    а хвост после последнего блока — к последнему элементу.
+    """
+    if _SEPARATOR.search(text):
+        parts = _SEPARATOR.split(text)
+    else:
+        ends = [match.end() for match in _CODE_BLOCK.finditer(text)]
+        if not ends:
+            return [text] if text.strip() else []
+        starts = [0] + ends[:-1]
+        ends[-1] = len(text)
+        parts = [text[start:end] for start, end in zip(starts, ends)]
+    return [part for part in parts if part.strip()]
+
+
+def parse_batch_text(text: str) -> Tuple[List[dict], List[int]]:
+    """Разбирает пачку; возвращает полные элементы и номера (с единицы) элементов без озвучки или кода."""
+    items, rejected = [], []
+    for number, part in enumerate(split_batch_text(text), start=1):
+        content = parse_user_input(part)
+        if is_complete(content):
+            items.append(content)
+        else:
+            rejected.append(number)
+    return items, rejected
+
+
+def parse_batch_jsonl(text: str) -> Tuple[List[dict], List[int]]:
+    """То же для JSONL: строка — объект с "text" или с готовыми полями содержимого."""
+    items, rejected = [], []
+    for number, line in enumerate((line for line in text.splitlines() if line.strip()), start=1):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            rejected.append(number)
+            continue
+        if "text" in record:
+            content = parse_user_input(record["text"])
+        else:
+            content = {field: str(record.get(field, "")).strip() for field in ("tts_text", "code_text", "top_text", "bottom_text")}
+            content["language"] = resolve_language(str(record.get("language", ""))) or DEFAULT_LANGUAGE
+        if is_complete(content):
+            items.append(content)
+        else:
+            rejected.append(number)
+    return items, rejected
+
+
+async def submit_item(scheduler: RenderScheduler, user_id: int, factory: Callable[[], Awaitable[Path]]) -> Path:
+    """Ставит элемент пачки в общую очередь рендера; если ее заняли другие, ждет места, а не проваливает элемент."""
+    delay = 0.5
+    while True:
+        try:
+            return await scheduler.submit(user_id, factory)
+        except QueueFullError:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BATCH_RETRY_MAX_SECONDS)
+
+
+async def run_batch(items: List[dict], render_item: ItemRenderer, concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[BatchResult]:
+    """Запускает все элементы и отдает результаты в порядке готовности.
+
+    Одновременно в работе не больше concurrency элементов, чтобы пачка не переполнила
+    общую очередь рендера; ошибка одного элемента не останавливает остальные. Если генератор
+    закрыть раньше (aclosing), незавершенные элементы отменяются и он ждет, пока они остановятся.
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, RENDER_QUEUE_SIZE)))
+
+    async def run_one(index: int, content: dict) -> BatchResult:
+        async with semaphore:
+            try:
+                return BatchResult(index, content, video_path=await render_item(index, content))
+            except Exception as e:
+                logger.error(f"Элемент пачки №{index} не удался: {e}")
+                return BatchResult(index, content, error=e)
+
+    tasks = [asyncio.create_task(run_one(index, content)) for index, content in enumerate(items, start=1)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _main(args) -> int:
+    # Импорт здесь: разбор пачки не должен тянуть за собой OpenAI и пул рендереров
+    from pipeline import generate_video, open_artifact_cache, render_pool
+    from render_queue import RenderScheduler
+
+    items, rejected = parse_batch_jsonl(Path(args.items).read_text(encoding="utf-8"))
+    if rejected:
+        logger.warning(f"Пропущены строки без озвучки или кода: {rejected}")
+    profile = PROFILES[args.profile]
+    out_dir = Path(args.out)
+    scheduler = RenderScheduler()
+
+    async def render_item(index: int, content: dict) -> Path:
+        job_dir = out_dir / f"item_{index:04d}"
+        job_dir.mkdir(parents=True, exist_ok=True)
+        return await submit_item(scheduler, 0, lambda: generate_video(content, args.format, job_dir, profile))
+
+    open_artifact_cache()
+    render_pool.start()
+    failed = 0
+    try:
+        async with aclosing(run_batch(items, render_item, args.concurrency)) as results:
+            async for result in results:
+                failed += result.error is not None
+                print(json.dumps({
+                    "index": result.index,
+                    "video": str(result.video_path) if result.video_path else None,
+                    "error": str(result.error) if result.error else None,
+                }, ensure_ascii=False), flush=True)
+    finally:
+        render_pool.shutdown()
+    return 1 if failed or rejected else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пакетная генерация видео из JSONL.")
+    parser.add_argument("items", help="JSONL-файл с элементами пачки")
+    parser.add_argument("--format", default="9:16", choices=["9:16", "16:9"])
+    parser.add_argument("--profile", default="standard", choices=list(PROFILES))
+    parser.add_argument("--out", default="static/batch", help="папка для готовых видео")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    raise SystemExit(asyncio.run(_main(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_duration.py
+"""Сравнение определения длительности: заголовки MP3 против pydub.AudioSegment.
+
+Запуск из backend/bot:
+    python benchmarks/bench_duration.py [--minutes 1 10 30] [--file narration.mp3 ...]
+
+Печатает по строке JSON на каждый замер: время, пиковая память Python (tracemalloc)
+и найденная длительность.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from media_probe import mp3_duration  # noqa: E402
+from synthetic_audio import write_synthetic_mp3  # noqa: E402
+
+
+def pydub_duration(path) -> float:
+    from pydub import AudioSegment
+    return AudioSegment.from_file(path).duration_seconds
+
+
+def measure(name: str, func, path: Path) -> dict:
+    # Время и память меряются разными прогонами: tracemalloc сильно замедляет код
+    started = time.perf_counter()
+    duration = func(path)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "method": name,
+        "file": path.name,
+        "size_bytes": path.stat().st_size,
+        "duration_s": round(duration, 3),
+        "wall_ms": round(elapsed * 1000, 2),
+        "peak_py_mem_bytes": peak,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="*", default=[1, 10, 30], help="длины синтетических озвучек")
+    parser.add_argument("--file", type=Path, nargs="*", default=[], help="реальные MP3 для замера")
+    parser.add_argument("--skip-pydub", action="store_true", help="не замерять старый путь через pydub")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = list(args.file)
+        for minutes in args.minutes:
+            path = Path(tmp) / f"synthetic_{minutes:g}min.mp3"
+            write_synthetic_mp3(path, minutes * 60)
+            files.append(path)
+
+        methods = [("mp3_headers", mp3_duration)]
+        if not args.skip_pydub:
+            try:
+                import pydub  # noqa: F401
+                methods.append(("pydub", pydub_duration))
+            except ImportError:
+                print("pydub не установлен, замеряю только mp3_headers", file=sys.stderr)
+
+        for path in files:
+            for name, func in methods:
+                print(json.dumps(measure(name, func, path)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# benchmarks/bench_pipeline.py
+"""Сквозной бенчмарк конвейера: настоящие CodeScene и ffmpeg, фейковые OpenAI, Telegram и YouTube.
+
+Запуск из backend/bot (нужны manim и ffmpeg, сеть и токены не нужны):
+    python benchmarks/bench_pipeline.py [--concurrency 1 4] [--formats 9:16 16:9] [--warm] [--output result.json]
+
+Каждый элемент корпуса проходит обработчики бота так же, как при нажатии кнопок:
+choose_format (черновое превью), confirm_render (финальный рендер) и загрузка на YouTube.
+Для каждого уровня параллельности печатается JSON со временем и CPU по этапам,
+пиковой памятью и пропускной способностью — его удобно сравнивать между коммитами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BOT_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+from content_parser import parse_user_input  # noqa: E402
+from render_profiles import PROFILES  # noqa: E402
+from fakes import FakeAsyncOpenAI, FakeApplication, FakeBot, FakeYouTubeClient, fake_context, fake_update  # noqa: E402
+
+# Модули бота импортируются в load_modules(), после настройки окружения. На уровне модуля
+# побочных эффектов нет: воркеры пула (forkserver) заново импортируют главный модуль
+bot = pipeline = None
+
+
+def load_modules(work_dir: Path) -> None:
+    """Направляет кэш, тексты Manim и папки заданий во временную work_dir и импортирует бота."""
+    global bot, pipeline
+    os.environ["CACHE_DIR"] = str(work_dir / "cache")
+    os.environ["MANIM_TEXT_DIR"] = str(work_dir / "media" / "texts")
+    os.environ["UPLOAD_SESSIONS_DIR"] = str(work_dir / "uploads")
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.chdir(work_dir)
+    import bot as bot_module
+    import pipeline as pipeline_module
+    bot, pipeline = bot_module, pipeline_module
+
+
+def load_corpus(path: Path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize_stages(records: list) -> dict:
+    stages = {}
+    for name, record in records:
+        stages.setdefault(name, []).append(record)
+    summary = {}
+    for name, items in sorted(stages.items()):
+        walls = [r["wall_s"] for r in items]
+        summary[name] = {
+            "count": len(items),
+            "failed": sum(not r["ok"] for r in items),
+            "cached": sum(bool(r.get("cached")) for r in items),
+            "wall_s_total": round(sum(walls), 4),
+            "wall_s_mean": round(sum(walls) / len(walls), 4),
+            "wall_s_p50": round(percentile(walls, 0.5), 4),
+            "wall_s_p95": round(percentile(walls, 0.95), 4),
+            "wall_s_max": round(max(walls), 4),
+            "cpu_s_total": round(sum(r["cpu_s"] for r in items), 4),
+        }
+        worker_cpu = [r["worker_cpu_s"] for r in items if "worker_cpu_s" in r]
+        if worker_cpu:
+            summary[name]["worker_cpu_s_total"] = round(sum(worker_cpu), 4)
+    return summary
+
+
+async def run_item(fake_bot: FakeBot, application: FakeApplication, item: dict, chosen_format: str, profile_name: str,
+                   user_id: int) -> dict:
+    """Один ролик через обработчики бота: превью, финальный рендер, загрузка на YouTube.
+
+    Загрузка на YouTube уходит в фон; ее ждет run_level, а время попадает в этап youtube_upload.
+    """
+    context = fake_context(fake_bot, {"content": parse_user_input(item["text"])}, application)
+    started = time.perf_counter()
+    steps = [
+        ("handler.choose_format", bot.choose_format, chosen_format, bot.CONFIRMING_RENDER),
+        ("handler.confirm_render", bot.confirm_render, f"render_{profile_name}", bot.ASK_YOUTUBE_UPLOAD),
+        ("handler.youtube_upload", bot.handle_youtube_upload_choice, "yt_upload_yes", bot.ConversationHandler.END),
+    ]
+    for stage_name, handler, data, expected_state in steps:
+        with pipeline.stage(stage_name):
+            state = await handler(fake_update(fake_bot, user_id, data), context)
+        if state != expected_state:
+            # Обработчик сам сообщил об ошибке в чат: берем последнее сообщение
+            error = next((text for call, chat_id, text in reversed(fake_bot.calls)
+                          if chat_id == user_id and call != "send_video"), "unknown")
+            return {"name": item["name"], "format": chosen_format, "ok": False, "failed_at": stage_name, "error": error}
+    return {"name": item["name"], "format": chosen_format, "ok": True, "wall_s": round(time.perf_counter() - started, 4)}
+
+
+async def run_level(corpus: list, formats: list, concurrency: int, profile_name: str, cache_mode: str, args) -> dict:
+    from render_queue import RenderScheduler
+    records = []
+    pipeline.stage_listeners.append(lambda name, record: records.append((name, record)))
+    fake_bot = FakeBot(upload_bytes_per_s=args.telegram_mbps * 1024 * 1024 / 8)
+    application = FakeApplication()
+    bot.render_scheduler = RenderScheduler(concurrency=concurrency, max_queued=len(corpus) * len(formats))
+    jobs = [(item, chosen_format) for item in corpus for chosen_format in formats]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(user_id: int, item: dict, chosen_format: str) -> dict:
+        async with semaphore:
+            return await run_item(fake_bot, application, item, chosen_format, profile_name, user_id)
+
+    started = time.perf_counter()
+    cpu_started = pipeline._cpu_seconds()
+    results = await asyncio.gather(*(limited(user_id, item, fmt) for user_id, (item, fmt) in enumerate(jobs, start=1)))
+    await application.wait_background()
+    wall = time.perf_counter() - started
+    cpu = pipeline._cpu_seconds() - cpu_started
+    pipeline.stage_listeners.clear()
+
+    worker_rss = [r.get("worker_maxrss_kb", 0) for _, r in records]
+    succeeded = sum(r["ok"] for r in results)
+    return {
+        "concurrency": concurrency,
+        "cache": cache_mode,
+        "items": len(jobs),
+        "succeeded": succeeded,
+        "wall_s": round(wall, 3),
+        # CPU процесса бота и завершившихся ffmpeg; CPU воркеров Manim — в этапе manim
+        "cpu_s": round(cpu, 3),
+        "throughput_per_min": round(succeeded / wall * 60, 3) if wall else 0.0,
+        "peak_rss_kb": {
+            # ru_maxrss — пик за все время процесса, а не только за этот уровень
+            "bot": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "ffmpeg": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            "render_worker": max(worker_rss, default=0),
+        },
+        "telegram": {"videos_sent": fake_bot.videos_sent, "bytes_sent": fake_bot.bytes_sent},
+        "stages": summarize_stages(records),
+        "results": list(results),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def run(args) -> dict:
+    import delivery
+    from cache import ArtifactCache
+    from render_pool import RenderPool
+    from youtube_uploader import YouTubeUploader
+    corpus = load_corpus(args.corpus)
+    pipeline._client = FakeAsyncOpenAI(first_byte_s=args.tts_first_byte, realtime_factor=args.tts_speed)
+    FakeYouTubeClient.upload_bytes_per_s = args.youtube_mbps * 1024 * 1024 / 8
+    bot.youtube_uploader = YouTubeUploader(sessions_dir=os.environ["UPLOAD_SESSIONS_DIR"], client_factory=FakeYouTubeClient)
+
+    runs = []
+    for concurrency in sorted(set(args.concurrency)):
+        # Каждый уровень начинается с пустым кэшем и свежим пулом того же размера
+        shutil.rmtree(os.environ["CACHE_DIR"], ignore_errors=True)
+        pipeline.artifact_cache = ArtifactCache()
+        delivery.file_id_registry = delivery.FileIdRegistry()
+        pipeline.render_pool = RenderPool(size=concurrency)
+        pipeline.render_pool.start()
+        try:
+            runs.append(await run_level(corpus, args.formats, concurrency, args.profile, "cold", args))
+            if args.warm:
+                runs.append(await run_level(corpus, args.formats, concurrency, args.profile, "warm", args))
+        finally:
+            pipeline.render_pool.shutdown()
+        print(f"concurrency={concurrency}: {runs[-1]['wall_s']} с", file=sys.stderr)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "profile": args.profile,
+        "formats": args.formats,
+        "corpus": [item["name"] for item in corpus],
+        "settings": {
+            "tts_format": pipeline.TTS_FORMAT,
+            "tts_streaming": pipeline.TTS_STREAMING,
+            "caption_layer": pipeline.CAPTION_LAYER,
+        },
+        "runs": runs,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=BENCH_DIR / "corpus.jsonl")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--formats", nargs="+", default=["9:16", "16:9"], choices=["9:16", "16:9"])
+    parser.add_argument("--profile", default="standard", choices=[name for name in PROFILES if name != "draft"])
+    parser.add_argument("--warm", action="store_true", help="повторить каждый уровень с прогретым кэшем")
+    parser.add_argument("--tts-first-byte", type=float, default=0.3, help="задержка первого байта TTS, с")
+    parser.add_argument("--tts-speed", type=float, default=20.0, help="во сколько раз TTS быстрее реального времени (0 — мгновенно)")
+    parser.add_argument("--telegram-mbps", type=float, default=0, help="имитация скорости отправки в Telegram, 0 — без задержки")
+    parser.add_argument("--youtube-mbps", type=float, default=0, help="имитация скорости загрузки на YouTube, 0 — без задержки")
+    parser.add_argument("--output", type=Path, help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочую папку бенчмарка")
+    args = parser.parse_args()
+    args.corpus = args.corpus.resolve()
+    if args.output:
+        args.output = args.output.resolve()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    try:
+        load_modules(work_dir)
+        report = asyncio.run(run(args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
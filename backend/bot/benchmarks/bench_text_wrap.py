@@ -0,0 +1,80 @@
+# benchmarks/bench_text_wrap.py
+"""Микробенчмарк переноса подписей: старый split_text_to_fit против text_measure.
+
+Запуск из backend/bot (нужен manim):
+    python benchmarks/bench_text_wrap.py [--words 10 40 120] [--repeat 3]
+
+Для каждой длины подписи печатает строку JSON со временем старой реализации,
+нового переноса с холодным кэшем ширин и с прогретым (как в долгоживущем воркере).
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from manim import Text, BOLD  # noqa: E402
+import text_measure  # noqa: E402
+
+VOCABULARY = (
+    "как работает генератор список словарь кортеж функция класс объект итератор "
+    "декоратор контекст менеджер исключение модуль пакет импорт async await yield lambda"
+).split()
+
+
+def legacy_split_text_to_fit(text: str, max_width: float, font: str = "Arial", weight=BOLD) -> str:
+    """Прежняя реализация из animate_code: Text на каждое добавленное слово."""
+    words = text.split()
+    lines: List[str] = []
+    current_line = ""
+    for word in words:
+        test_line = (current_line + " " + word).strip()
+        test_mob = Text(test_line, font=font, weight=weight)
+        if test_mob.width <= max_width or not current_line:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word
+    if current_line:
+        lines.append(current_line)
+    return "\n".join(lines)
+
+
+def timed(func, *args) -> tuple:
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="*", default=[10, 40, 120], help="длины подписей в словах")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-width", type=float, default=9 * 0.95, help="ширина кадра 9:16 в единицах manim")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for count in args.words:
+        text = " ".join(rng.choice(VOCABULARY) for _ in range(count))
+        legacy = min(timed(legacy_split_text_to_fit, text, args.max_width)[0] for _ in range(args.repeat))
+
+        text_measure.word_width.cache_clear()
+        text_measure.space_width.cache_clear()
+        cold, wrapped = timed(text_measure.wrap_text, text, args.max_width)
+        warm = min(timed(text_measure.wrap_text, text, args.max_width)[0] for _ in range(args.repeat))
+
+        print(json.dumps({
+            "words": count,
+            "legacy_ms": round(legacy * 1000, 1),
+            "cold_ms": round(cold * 1000, 1),
+            "warm_ms": round(warm * 1000, 1),
+            "same_layout": wrapped == legacy_split_text_to_fit(text, args.max_width),
+        }), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# benchmarks/fakes.py
+"""Локальные заменители OpenAI TTS, Telegram Bot API и YouTubeClient для бенчмарков.
+
+Сеть не используется: озвучка — синтетический MP3 нужной длины, отправка в Telegram
+и загрузка на YouTube только читают файл и при желании имитируют пропускную способность.
+"""
+import asyncio
+import hashlib
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from synthetic_audio import synthetic_mp3_frames
+
+# Средний темп речи TTS: по нему из текста получается длительность озвучки
+WORDS_PER_SECOND = 2.5
+
+
+class _FakeSpeechResponse:
+    def __init__(self, speech: "FakeSpeech", text: str, response_format: str):
+        if response_format != "mp3":
+            raise ValueError(f"Фейковый TTS умеет только mp3, запрошен {response_format}")
+        self._speech = speech
+        self.seconds = max(1.0, len(text.split()) / WORDS_PER_SECOND)
+
+    async def iter_bytes(self):
+        await asyncio.sleep(self._speech.first_byte_s)
+        for chunk in synthetic_mp3_frames(self.seconds):
+            if self._speech.realtime_factor:
+                # Один кусок — 32 фрейма по 1152 сэмпла при 44.1 кГц
+                await asyncio.sleep(32 * 1152 / 44100 / self._speech.realtime_factor)
+            self._speech.bytes_sent += len(chunk)
+            yield chunk
+
+    async def stream_to_file(self, path):
+        with open(path, "wb") as f:
+            async for chunk in self.iter_bytes():
+                f.write(chunk)
+
+    async def __aenter__(self):
+        self._speech.requests += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSpeech:
+    """client.audio.speech с with_streaming_response.create(...), как у AsyncOpenAI."""
+
+    def __init__(self, first_byte_s: float = 0.3, realtime_factor: float = 20.0):
+        self.first_byte_s = first_byte_s
+        self.realtime_factor = realtime_factor  # во сколько раз TTS быстрее реального времени; 0 — мгновенно
+        self.requests = 0
+        self.bytes_sent = 0
+        self.with_streaming_response = SimpleNamespace(create=self._create)
+
+    def _create(self, model: str, voice: str, input: str, response_format: str = "mp3"):
+        return _FakeSpeechResponse(self, input, response_format)
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, **speech_options):
+        self.audio = SimpleNamespace(speech=FakeSpeech(**speech_options))
+
+
+class FakeMessage:
+    def __init__(self, chat_id: int, message_id: int = 1):
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+
+class FakeCallbackQuery:
+    """Нажатие inline-кнопки: только то, что используют обработчики bot.py."""
+
+    def __init__(self, bot: "FakeBot", chat_id: int, data: str):
+        self.bot = bot
+        self.data = data
+        self.message = FakeMessage(chat_id)
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text: str, **kwargs):
+        self.bot.calls.append(("edit_message_text", self.message.chat_id, text))
+
+
+class FakeBot:
+    """Bot API без сети: запоминает вызовы и имитирует загрузку видео с заданной скоростью."""
+
+    def __init__(self, upload_bytes_per_s: float = 0):
+        self.upload_bytes_per_s = upload_bytes_per_s
+        self.calls = []
+        self.videos_sent = 0
+        self.bytes_sent = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.calls.append(("send_message", chat_id, text))
+        return FakeMessage(chat_id, message_id=len(self.calls))
+
+    async def edit_message_text(self, text: str, chat_id: int = None, message_id: int = None, **kwargs):
+        self.calls.append(("edit_message_text", chat_id, text))
+
+    async def send_video(self, chat_id: int, video, filename: str = None, caption: str = None, **kwargs):
+        self.videos_sent += 1
+        self.calls.append(("send_video", chat_id, filename))
+        if isinstance(video, str):
+            # Отправка по file_id: загрузки нет
+            return SimpleNamespace(video=SimpleNamespace(file_id=video), document=None)
+        size = len(video)
+        if self.upload_bytes_per_s:
+            await asyncio.sleep(size / self.upload_bytes_per_s)
+        self.bytes_sent += size
+        file_id = f"fake-{hashlib.sha256(video).hexdigest()[:16]}"
+        return SimpleNamespace(video=SimpleNamespace(file_id=file_id), document=None)
+
+
+def fake_update(bot: FakeBot, user_id: int, data: str):
+    """Update с callback_query от пользователя user_id (чат совпадает с пользователем)."""
+    return SimpleNamespace(
+        callback_query=FakeCallbackQuery(bot, user_id, data),
+        effective_user=SimpleNamespace(id=user_id),
+        message=None,
+    )
+
+
+class FakeApplication:
+    """Application.create_task: фоновые задачи обработчиков собираются, чтобы их можно было дождаться."""
+
+    def __init__(self):
+        self.tasks = []
+
+    def create_task(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+    async def wait_background(self):
+        while self.tasks:
+            tasks, self.tasks = self.tasks, []
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def fake_context(bot: FakeBot, user_data: dict = None, application: FakeApplication = None):
+    return SimpleNamespace(
+        bot=bot, user_data=user_data if user_data is not None else {}, application=application or FakeApplication(),
+    )
+
+
+class FakeYouTubeClient:
+    """Заменитель YouTubeClient: читает файл, как при загрузке, и возвращает фиктивный id."""
+
+    upload_bytes_per_s = 0.0  # 0 — без имитации сети
+    chunk_size = 8 * 1024 * 1024
+
+    def is_authorized(self):
+        return True
+
+    def refresh_if_expiring(self):
+        pass
+
+    def upload_video(self, file_path, title, description, tags, privacy_status="public", session=None, on_progress=None):
+        digest = hashlib.sha256()
+        total = Path(file_path).stat().st_size
+        size = 0
+        with open(file_path, "rb") as f:
+            while chunk := f.read(self.chunk_size):
+                digest.update(chunk)
+                size += len(chunk)
+                if self.upload_bytes_per_s:
+                    time.sleep(len(chunk) / self.upload_bytes_per_s)
+                if session:
+                    session.update(f"fake://{session.key}", size)
+                if on_progress:
+                    on_progress(size / total)
+        return {"id": f"bench-{digest.hexdigest()[:11]}"}
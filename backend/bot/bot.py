@@ -1,22 +1,30 @@
 # === ФИНАЛЬНАЯ ВЕРСИЯ bot.py ===
 
 import logging
-import re
 import asyncio
 import os
 import uuid
-import subprocess
 import shutil
-from youtube_client import YouTubeClient
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from youtube_uploader import YouTubeUploader, UploadSession, YouTubeAuthError
+from content_parser import parse_user_input, is_complete
+from batch import parse_batch_text, parse_batch_jsonl, run_batch, submit_item, BATCH_MAX_ITEMS
+from pipeline import generate_video, open_artifact_cache, render_pool, stage, current_job
+from broker import RENDER_BACKEND, generate_remote, follow_worker_capacity
+from metrics import setup_metrics
+from delivery import send_video
+from render_queue import RenderScheduler, QueueFullError
+from loop_monitor import LoopLagMonitor
+from render_profiles import PROFILES, RenderProfile
 from pathlib import Path
-from openai import OpenAI
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters,
     ContextTypes, ConversationHandler, CallbackQueryHandler
 )
-from pydub import AudioSegment
 
 # --- Настройка ---
 load_dotenv()
@@ -24,52 +32,43 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not TELEGRAM_BOT_TOKEN or not OPENAI_API_KEY:
     raise ValueError("Не удалось загрузить токены. Убедитесь, что они есть в .env файле.")
-client = OpenAI(api_key=OPENAI_API_KEY)
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 logger = logging.getLogger(__name__)
 
+# Очередь между обработчиками диалога и конвейером рендера
+render_scheduler = RenderScheduler()
+# remote: рендер на воркерах (worker.py) через брокер, бот только ведет диалог и отправляет видео
+render_video = generate_remote if RENDER_BACKEND == "remote" else generate_video
+# Google API синхронный, поэтому авторизация идет в отдельных потоках, а загрузки — в пуле загрузчика
+youtube_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="youtube")
+# Один авторизованный клиент YouTube на весь процесс и фоновые загрузки с докачкой
+youtube_uploader = YouTubeUploader()
+loop_lag_monitor = LoopLagMonitor()
+
 # --- Состояния диалога ---
-GETTING_CONTENT, CHOOSING_FORMAT, WAITING_FOR_URL, ASK_YOUTUBE_UPLOAD = range(4)
+GETTING_CONTENT, CHOOSING_FORMAT, WAITING_FOR_URL, ASK_YOUTUBE_UPLOAD, CONFIRMING_RENDER = range(5)
 
 # --- Вспомогательные функции ---
-def parse_user_input(text: str) -> dict:
-    extracted_data = {"tts_text": "", "code_text": "", "top_text": "", "bottom_text": ""}
-    text_to_process = text
-    top_match = re.search(r'!!!([\s\S]*?)!!!', text_to_process)
-    if top_match:
-        extracted_data["top_text"] = top_match.group(1).strip()
-        text_to_process = text_to_process.replace(top_match.group(0), "", 1)
-    bottom_match = re.search(r'@@([\s\S]*?)@@', text_to_process)
-    if bottom_match:
-        extracted_data["bottom_text"] = bottom_match.group(1).strip()
-        text_to_process = text_to_process.replace(bottom_match.group(0), "", 1)
-    code_match = re.search(r'\/\/\/[a-zA-Z]*\n?([\s\S]*?)\/\/\/', text_to_process)
-    if code_match:
-        extracted_data["code_text"] = code_match.group(1).strip()
-        text_to_process = text_to_process.replace(code_match.group(0), "", 1)
-    extracted_data["tts_text"] = text_to_process.strip()
-    return extracted_data
-
 async def cleanup_temp_folders(context: ContextTypes.DEFAULT_TYPE, final_video_path_str: str = None):
-    """Функция для очистки временных папок."""
+    """Удаляет папку задания (видео, превью, аудио и media Manim). Чужие задания не затрагиваются."""
+    job_dir = context.user_data.get('job_dir')
     if final_video_path_str:
-        final_video_path = Path(final_video_path_str)
-        if final_video_path.parent.exists():
-            shutil.rmtree(final_video_path.parent)
-            logger.info(f"Временная папка для видео {final_video_path.parent} удалена.")
-
-    if Path("media").exists():
-        shutil.rmtree("media")
-        logger.info("Временная папка 'media' удалена.")
+        job_dir = str(Path(final_video_path_str).parent)
+    if job_dir and Path(job_dir).exists():
+        await asyncio.to_thread(shutil.rmtree, job_dir)
+        logger.info(f"Временная папка для видео {job_dir} удалена.")
 
     context.user_data.clear()
 
 # --- Основная логика бота ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    await update.message.reply_text("Привет! Пришлите текст для озвучки, код (внутри ///) и надписи (!!!сверху!!! и @@снизу@@).")
+    await update.message.reply_text(
+        "Привет! Пришлите текст для озвучки, код (внутри ///) и надписи (!!!сверху!!! и @@снизу@@).\n"
+        "Для пачки роликов пришлите текстовый файл с несколькими блоками /// или JSONL."
+    )
     return GETTING_CONTENT
 
 async def start_over(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -80,8 +79,9 @@ async def start_over(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def get_content(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_input = update.message.text
-    parsed_data = parse_user_input(user_input)
-    if not parsed_data["tts_text"] or not parsed_data["code_text"]:
+    with stage("parse"):
+        parsed_data = parse_user_input(user_input)
+    if not is_complete(parsed_data):
         await update.message.reply_text("Не удалось найти текст для озвучки или блок кода. Попробуйте снова /start.")
         return GETTING_CONTENT
     context.user_data['content'] = parsed_data
@@ -90,7 +90,58 @@ async def get_content(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     await update.message.reply_text("Отлично! Теперь выберите формат видео:", reply_markup=reply_markup)
     return CHOOSING_FORMAT
 
+async def generate_in_queue(update: Update, query, content: dict, chosen_format: str, profile: RenderProfile, job_dir: Path) -> Path:
+    """Ставит генерацию в общую очередь, показывая пользователю позицию, и ждет готовое видео."""
+    async def report_position(position: int) -> None:
+        if position:
+            await query.edit_message_text(text=f"Принято! Формат: {chosen_format}, {profile.title}. Вы в очереди: №{position}")
+        else:
+            await query.edit_message_text(text=f"Принято! Формат: {chosen_format}, {profile.title}. Создаю видео...")
+
+    return await render_scheduler.submit(
+        update.effective_user.id,
+        lambda: render_video(content, chosen_format, job_dir, profile),
+        on_position=report_position,
+    )
+
+async def send_video_file(context: ContextTypes.DEFAULT_TYPE, chat_id: int, video_path, caption: str = None) -> None:
+    with stage("telegram_upload") as record:
+        # Уже отправленный ролик уходит по file_id без загрузки, см. delivery
+        record["bytes"] = await send_video(context.bot, chat_id, video_path, caption=caption)
+        record["cached"] = record["bytes"] == 0
+
+async def report_generation_error(query, context: ContextTypes.DEFAULT_TYPE, error: Exception) -> int:
+    if isinstance(error, QueueFullError):
+        logger.warning("Очередь рендера переполнена, задание отклонено.")
+        await query.edit_message_text(text="Сейчас слишком много заявок на видео. Попробуйте чуть позже: /start")
+    else:
+        logger.error(f"Ошибка при создании видео: {error}", exc_info=error)
+        await context.bot.send_message(chat_id=query.message.chat_id, text=f"Произошла ошибка: {error}")
+    await cleanup_temp_folders(context)
+    return ConversationHandler.END
+
+def one_render_at_a_time(handler):
+    """Повторные нажатия, пока рендер пользователя идет, игнорируются.
+
+    При concurrent_updates состояние диалога меняется только после возврата обработчика,
+    то есть через минуты, и без этой защиты второе нажатие запускало бы второй рендер
+    и перезаписывало job_dir первого.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.user_data.get('render_in_flight'):
+            await update.callback_query.answer("Видео уже создается, подождите.")
+            return None
+        context.user_data['render_in_flight'] = True
+        try:
+            return await handler(update, context)
+        finally:
+            context.user_data.pop('render_in_flight', None)
+    return wrapper
+
+@one_render_at_a_time
 async def choose_format(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Сначала делает быстрое черновое превью; полный рендер — только после подтверждения."""
     query = update.callback_query
     await query.answer()
     chosen_format = query.data
@@ -100,88 +151,109 @@ async def choose_format(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await query.edit_message_text(text="Ошибка. Начните сначала /start")
         return ConversationHandler.END
 
-    await query.edit_message_text(text=f"Принято! Формат: {chosen_format}. Создаю видео...")
-
     unique_id = uuid.uuid4()
-    final_video_dir = Path(f"static/videos/{unique_id}/")
-    final_video_dir.mkdir(parents=True, exist_ok=True)
-    audio_path = final_video_dir / "audio.mp3"
-    final_video_path = final_video_dir / "final_video.mp4"
+    job_dir = Path(f"static/videos/{unique_id}/")
+    job_dir.mkdir(parents=True, exist_ok=True)
+    context.user_data['job_dir'] = str(job_dir)
+    context.user_data['format'] = chosen_format
+    current_job.set(job_dir.name)
 
     try:
-        # Генерация аудио (новый, правильный способ)
-        logger.info("Генерация аудио...")
-        with client.audio.speech.with_streaming_response.create(
-            model="tts-1",
-            voice="alloy",
-            input=content["tts_text"]
-        ) as response:
-            response.stream_to_file(audio_path)
-
-        # === Вычисляем длительность аудиофайла ===
-        audio = AudioSegment.from_file(audio_path)
-        audio_duration = audio.duration_seconds
-
-        # Генерация видеоряда Manim
-        env = os.environ.copy()
-        env["CODE_TEXT"] = content["code_text"]
-        env["TOP_TEXT"] = content["top_text"]
-        env["BOTTOM_TEXT"] = content["bottom_text"]
-        env["RESOLUTION"] = "1080,1920" if chosen_format == "9:16" else "1920,1080"
-        env["AUDIO_DURATION"] = str(audio_duration)
-        manim_command = ["python", "-m", "manim", "animate_code.py", "CodeScene"]
-        process = await asyncio.create_subprocess_exec(*manim_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env)
-        _, stderr = await process.communicate()
-        if process.returncode != 0:
-            raise Exception(f"Manim завершился с ошибкой: {stderr.decode()}")
-
-        # Динамически формируем путь к выходному файлу Manim
-        # В animate_code.py framerate=30, а разрешение (вертикальное) 1920 для 9:16 и 1080 для 16:9
-        resolution_folder = "1920p30" if chosen_format == "9:16" else "1080p30"
-        search_path = Path(f"media/videos/animate_code/{resolution_folder}")
-        found_files = list(search_path.rglob("*.mp4"))
-        print(f"[BOT DEBUG] Ищу mp4 в: {search_path.resolve()}")
-        if not found_files:
-            raise Exception(f"Не удалось найти видеофайл Manim в {search_path}")
-        manim_output_file = found_files[0]
-
-        # Склейка аудио и видео
-        ffmpeg_command = ['ffmpeg', '-i', str(manim_output_file), '-i', str(audio_path), '-c:v', 'copy', '-c:a', 'aac', '-shortest', str(final_video_path)]
-        subprocess.run(ffmpeg_command, check=True, capture_output=True, text=True)
-
-        if not final_video_path.exists():
-            raise Exception("FFmpeg отработал, но финальный видеофайл не был создан.")
-
-        logger.info(f"Финальное видео создано: {final_video_path}")
-
-        # Отправка видео в Telegram
-        await context.bot.send_message(chat_id=query.message.chat_id, text="✅ Ваше видео готово! Сейчас я его отправлю...")
-        await context.bot.send_video(
-            chat_id=query.message.chat_id, video=open(final_video_path, 'rb'), read_timeout=120, write_timeout=120
-        )
+        with stage("time_to_video") as record:
+            record["profile"] = "draft"
+            preview_path = await generate_in_queue(update, query, content, chosen_format, PROFILES["draft"], job_dir)
+            await send_video_file(context, query.message.chat_id, preview_path, caption="Черновое превью: проверьте раскладку.")
+    except Exception as e:
+        return await report_generation_error(query, context, e)
+
+    keyboard = [
+        [InlineKeyboardButton(PROFILES["standard"].title, callback_data="render_standard"),
+         InlineKeyboardButton(PROFILES["high"].title, callback_data="render_high")],
+        [InlineKeyboardButton("Отмена", callback_data="render_cancel")],
+    ]
+    await context.bot.send_message(
+        chat_id=query.message.chat_id, text="Рендерить финальное видео?", reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return CONFIRMING_RENDER
 
-        # Сохраняем данные для следующего шага
-        context.user_data['final_video_path'] = str(final_video_path)
-        context.user_data['video_content'] = content
-
-        # Задаем вопрос про YouTube
-        keyboard = [[
-            InlineKeyboardButton("Да, загрузить", callback_data="yt_upload_yes"),
-            InlineKeyboardButton("Нет, спасибо", callback_data="yt_upload_no")
-        ]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await context.bot.send_message(
-            chat_id=query.message.chat_id, text="Загрузить это видео на YouTube?", reply_markup=reply_markup
-        )
+@one_render_at_a_time
+async def confirm_render(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    choice = query.data
+    content = context.user_data.get('content')
+    job_dir = context.user_data.get('job_dir')
+    chosen_format = context.user_data.get('format')
 
-        return ASK_YOUTUBE_UPLOAD
+    if choice == "render_cancel":
+        await query.edit_message_text(text="Хорошо, финальный рендер отменен.")
+        await cleanup_temp_folders(context)
+        return ConversationHandler.END
 
-    except Exception as e:
-        logger.error(f"Ошибка при создании видео: {e}", exc_info=True)
-        await context.bot.send_message(chat_id=query.message.chat_id, text=f"Произошла ошибка: {e}")
-        await cleanup_temp_folders(context, str(final_video_path) if 'final_video_path' in locals() else None)
+    if not content or not job_dir:
+        await query.edit_message_text(text="Ошибка. Начните сначала /start")
         return ConversationHandler.END
 
+    profile = PROFILES[choice.removeprefix("render_")]
+    current_job.set(Path(job_dir).name)
+    try:
+        with stage("time_to_video") as record:
+            record["profile"] = profile.name
+            final_video_path = await generate_in_queue(update, query, content, chosen_format, profile, Path(job_dir))
+
+            # Отправка видео в Telegram
+            await context.bot.send_message(chat_id=query.message.chat_id, text="✅ Ваше видео готово! Сейчас я его отправлю...")
+            await send_video_file(context, query.message.chat_id, final_video_path)
+    except Exception as e:
+        return await report_generation_error(query, context, e)
+
+    # Сохраняем данные для следующего шага
+    context.user_data['final_video_path'] = str(final_video_path)
+    context.user_data['video_content'] = content
+
+    # Задаем вопрос про YouTube
+    keyboard = [[
+        InlineKeyboardButton("Да, загрузить", callback_data="yt_upload_yes"),
+        InlineKeyboardButton("Нет, спасибо", callback_data="yt_upload_no")
+    ]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await context.bot.send_message(
+        chat_id=query.message.chat_id, text="Загрузить это видео на YouTube?", reply_markup=reply_markup
+    )
+
+    return ASK_YOUTUBE_UPLOAD
+
+async def run_youtube_upload(bot, session: UploadSession, message_id: int = None) -> None:
+    """Фоновая загрузка: прогресс правится в одном сообщении, по завершении папка задания удаляется."""
+    chat_id = session.chat_id
+    if message_id is None:
+        message = await bot.send_message(chat_id=chat_id, text=f"Загрузка на YouTube «{session.title}»...")
+        message_id = message.message_id
+
+    async def report_progress(fraction: float) -> None:
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=f"Загрузка на YouTube: {int(fraction * 100)}%")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс загрузки: {e}")
+
+    current_job.set(Path(session.file_path).parent.name)
+    try:
+        with stage("youtube_upload") as record:
+            record["bytes"] = Path(session.file_path).stat().st_size - session.progress
+            upload_response = await youtube_uploader.upload(session, report_progress)
+        if upload_response and upload_response.get("id"):
+            video_url = f"https://www.youtube.com/watch?v={upload_response['id']}"
+            await bot.send_message(chat_id=chat_id, text=f"✅ Видео успешно загружено на YouTube!\n\nСсылка: {video_url}")
+        else:
+            await bot.send_message(chat_id=chat_id, text="❌ Произошла неизвестная ошибка при загрузке видео на YouTube.")
+    except YouTubeAuthError as e:
+        await bot.send_message(chat_id=chat_id, text=f"❌ Ошибка: {e}")
+    except Exception as e:
+        logger.error(f"Ошибка загрузки на YouTube: {e}", exc_info=e)
+        await bot.send_message(chat_id=chat_id, text=f"❌ Не удалось загрузить видео на YouTube: {e}")
+    finally:
+        await asyncio.to_thread(shutil.rmtree, Path(session.file_path).parent, True)
+
 async def handle_youtube_upload_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -190,34 +262,27 @@ async def handle_youtube_upload_choice(update: Update, context: ContextTypes.DEF
     final_video_path = context.user_data.get('final_video_path')
     content = context.user_data.get('video_content')
 
-    try:
-        if choice == "yt_upload_no":
-            await query.edit_message_text(text="Хорошо, загрузка на YouTube отменена.")
-
-        elif choice == "yt_upload_yes":
-            if not final_video_path or not content:
-                await query.edit_message_text(text="Ошибка, данные о видео утеряны. Начните сначала.")
-                return ConversationHandler.END
-
-            await query.edit_message_text(text="Начинаю загрузку на YouTube...")
-            youtube_client = YouTubeClient()
-            if not youtube_client.is_authorized():
-                await context.bot.send_message(chat_id=query.message.chat_id, text="❌ Ошибка: Авторизация YouTube не найдена. Пожалуйста, сначала выполните команду /youtube_auth.")
-            else:
-                video_title = content["top_text"] if content["top_text"] else "Видео с кодом"
-                video_description = content["tts_text"]
-                upload_response = youtube_client.upload_video(
-                    file_path=final_video_path, title=video_title, description=video_description, tags=[], privacy_status="private"
-                )
-                if upload_response and upload_response.get("id"):
-                    video_id = upload_response.get("id")
-                    video_url = f"https://www.youtube.com/watch?v={video_id}"
-                    await context.bot.send_message(chat_id=query.message.chat_id, text=f"✅ Видео успешно загружено на YouTube!\n\nСсылка: {video_url}")
-                else:
-                    await context.bot.send_message(chat_id=query.message.chat_id, text="❌ Произошла неизвестная ошибка при загрузке видео на YouTube.")
-    finally:
-        await cleanup_temp_folders(context, final_video_path)
+    if choice == "yt_upload_yes" and final_video_path and content:
+        youtube_client = await youtube_uploader.get_client()
+        if not youtube_client.is_authorized():
+            await context.bot.send_message(chat_id=query.message.chat_id, text="❌ Ошибка: Авторизация YouTube не найдена. Пожалуйста, сначала выполните команду /youtube_auth.")
+        else:
+            session = await asyncio.to_thread(
+                youtube_uploader.new_session, query.message.chat_id, final_video_path,
+                title=content["top_text"] if content["top_text"] else "Видео с кодом",
+                description=content["tts_text"], tags=[], privacy_status="private",
+            )
+            await query.edit_message_text(text="Загрузка на YouTube поставлена в очередь, прогресс будет здесь.")
+            # Загрузка идет в фоне: диалог завершается, а папку задания удалит run_youtube_upload
+            context.application.create_task(run_youtube_upload(context.bot, session, query.message.message_id))
+            context.user_data.clear()
+            return ConversationHandler.END
+    elif choice == "yt_upload_yes":
+        await query.edit_message_text(text="Ошибка, данные о видео утеряны. Начните сначала.")
+    else:
+        await query.edit_message_text(text="Хорошо, загрузка на YouTube отменена.")
 
+    await cleanup_temp_folders(context, final_video_path)
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -226,12 +291,13 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 async def youtube_auth(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    youtube_client = YouTubeClient()
+    loop = asyncio.get_running_loop()
+    youtube_client = await youtube_uploader.get_client()
     if youtube_client.is_authorized():
         await update.message.reply_text("✅ Авторизация в YouTube уже пройдена и активна!")
         return ConversationHandler.END
 
-    auth_url = youtube_client.initiate_authorization()
+    auth_url = await loop.run_in_executor(youtube_executor, youtube_client.initiate_authorization)
     context.user_data['youtube_client'] = youtube_client
     await update.message.reply_text(
         "Сейчас начнется ручная авторизация:\n\n"
@@ -253,7 +319,8 @@ async def handle_pasted_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return ConversationHandler.END
 
     await update.message.reply_text("Проверяю URL, пожалуйста, подождите...")
-    if youtube_client.complete_authorization(pasted_url):
+    authorized = await asyncio.get_running_loop().run_in_executor(youtube_executor, youtube_client.complete_authorization, pasted_url)
+    if authorized:
         await update.message.reply_text("✅ Авторизация успешно завершена! Теперь можно загружать видео.")
     else:
         await update.message.reply_text("❌ Не удалось завершить авторизацию. URL недействителен или истек. Попробуйте снова: /youtube_auth")
@@ -261,15 +328,88 @@ async def handle_pasted_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
     context.user_data.clear()
     return ConversationHandler.END
 
+async def handle_batch_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пакет роликов из файла: блоки ///код/// (или элементы через "===") либо JSONL.
+
+    Формат берется из подписи к файлу ("16:9", иначе 9:16), качество — стандартное, без
+    чернового превью. Ролики отправляются по мере готовности.
+    """
+    document = update.message.document
+    chat_id = update.message.chat_id
+    file = await document.get_file()
+    try:
+        text = (await file.download_as_bytearray()).decode("utf-8")
+    except UnicodeDecodeError:
+        await update.message.reply_text("Файл должен быть текстовым в кодировке UTF-8.")
+        return
+    is_jsonl = (document.file_name or "").lower().endswith(".jsonl")
+    items, rejected = await asyncio.to_thread(parse_batch_jsonl if is_jsonl else parse_batch_text, text)
+    if not items:
+        await update.message.reply_text("В файле не найдено ни одного элемента с текстом для озвучки и блоком кода.")
+        return
+    if len(items) > BATCH_MAX_ITEMS:
+        await update.message.reply_text(f"Слишком много роликов в одном файле: {len(items)}, максимум {BATCH_MAX_ITEMS}.")
+        return
+
+    chosen_format = "16:9" if "16:9" in (update.message.caption or "") else "9:16"
+    profile = PROFILES["standard"]
+    batch_dir = Path(f"static/videos/batch_{uuid.uuid4()}")
+    note = f" Пропущены элементы без озвучки или кода: {', '.join(map(str, rejected))}." if rejected else ""
+    await update.message.reply_text(f"Принято роликов: {len(items)}, формат {chosen_format}.{note} Отправлю каждый, как только он будет готов.")
+
+    async def render_item(index: int, content: dict) -> Path:
+        job_dir = batch_dir / f"item_{index:04d}"
+        job_dir.mkdir(parents=True, exist_ok=True)
+        # Элементы пачки ждут места в общей очереди, а не проваливаются, если ее заняли другие пользователи
+        return await submit_item(
+            render_scheduler, update.effective_user.id, lambda: render_video(content, chosen_format, job_dir, profile)
+        )
+
+    done = 0
+    try:
+        # aclosing: если отправка упадет посреди пачки, оставшиеся элементы остановятся до удаления batch_dir
+        async with contextlib.aclosing(run_batch(items, render_item)) as results:
+            async for result in results:
+                done += 1
+                if result.error:
+                    await context.bot.send_message(chat_id=chat_id, text=f"❌ Ролик {result.index} ({done}/{len(items)}): {result.error}")
+                    continue
+                await send_video_file(context, chat_id, result.video_path, caption=f"Ролик {result.index} ({done}/{len(items)})")
+                await asyncio.to_thread(shutil.rmtree, result.video_path.parent, True)
+    finally:
+        await asyncio.to_thread(shutil.rmtree, batch_dir, True)
+    await context.bot.send_message(chat_id=chat_id, text="✅ Пакет готов.")
+
+async def post_init(application: Application) -> None:
+    loop_lag_monitor.start()
+    setup_metrics(render_scheduler, loop_lag_monitor)
+    if RENDER_BACKEND == "remote":
+        # Число заданий, одновременно отданных воркерам, следует за числом их реплик
+        application.create_task(follow_worker_capacity(render_scheduler))
+    # Загрузки, прерванные прошлым перезапуском, продолжаются с подтвержденного смещения
+    for session in await asyncio.to_thread(youtube_uploader.pending_sessions):
+        logger.info(f"Продолжаю загрузку на YouTube {session.key} с {session.progress} байт.")
+        application.create_task(run_youtube_upload(application.bot, session))
+
+async def post_shutdown(application: Application) -> None:
+    loop_lag_monitor.stop()
+    render_pool.shutdown()
+    youtube_executor.shutdown(wait=False)
+    youtube_uploader.shutdown()
+
 def main() -> None:
     os.makedirs("static/videos", exist_ok=True)
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    open_artifact_cache()
+    if RENDER_BACKEND != "remote":
+        render_pool.start()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).post_init(post_init).post_shutdown(post_shutdown).build()
 
     generation_conv = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
             GETTING_CONTENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_content)],
             CHOOSING_FORMAT: [CallbackQueryHandler(choose_format)],
+            CONFIRMING_RENDER: [CallbackQueryHandler(confirm_render, pattern="^render_")],
             ASK_YOUTUBE_UPLOAD: [CallbackQueryHandler(handle_youtube_upload_choice)]
         },
         fallbacks=[CommandHandler("cancel", cancel), CommandHandler("start", start_over)],
@@ -287,6 +427,8 @@ def main() -> None:
 
     application.add_handler(generation_conv)
     application.add_handler(auth_conv)
+    # Пакетный режим: файл с множеством роликов, вне диалога /start
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_batch_document))
 
     application.run_polling()
 
@@ -0,0 +1,387 @@
+# broker.py
+"""Очередь заданий между ботом и воркерами рендера на других машинах.
+
+Бот только ставит задание и ждет результат; воркеры (worker.py) забирают задания,
+рендерят и кладут видео в общее хранилище (папка static/videos, смонтированная у всех).
+Задание выдается воркеру в аренду: воркер продлевает ее, пока работает, а если он упал,
+аренда истекает и задание возвращается в очередь.
+
+Брокеры: Redis (несколько машин) и SQLite (одна машина, тесты). Выбор — по BROKER_URL:
+redis://host:6379/0 или sqlite:///path/to/broker.db.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Optional, Tuple
+from render_profiles import RenderProfile
+
+logger = logging.getLogger(__name__)
+
+# local — рендер в процессе бота, remote — через брокер на воркерах
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "local")
+BROKER_URL = os.getenv("BROKER_URL", "sqlite:///cache/broker.db")
+RENDER_LEASE_SECONDS = float(os.getenv("RENDER_LEASE_SECONDS", "60"))
+# После стольких истекших аренд (воркер падал на этом задании) оно считается неудачным
+RENDER_MAX_ATTEMPTS = int(os.getenv("RENDER_MAX_ATTEMPTS", "3"))
+RESULT_POLL_INTERVAL = float(os.getenv("RESULT_POLL_INTERVAL", "0.5"))
+CAPACITY_POLL_INTERVAL = float(os.getenv("CAPACITY_POLL_INTERVAL", "5"))
+
+
+class BrokerError(Exception):
+    """Задание не выполнено воркером."""
+
+
+class SqliteBroker:
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, worker TEXT, "
+                "lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, slots INTEGER NOT NULL, alive_until REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение на вызов: методы зовутся из разных потоков
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def enqueue(self, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, payload, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+        return job_id
+
+    def claim(self, worker_id: str, lease_seconds: float = RENDER_LEASE_SECONDS) -> Optional[Tuple[str, dict]]:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(conn, now)
+                # Возвращенные задания сохраняют created_at и потому идут первыми
+                row = conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, lease_until = ? WHERE id = ?",
+                        (worker_id, now + lease_seconds, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float = RENDER_LEASE_SECONDS) -> bool:
+        """Продлевает аренду; False, если задание уже отдано другому воркеру или отменено."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> None:
+        self._finish(job_id, worker_id, "done", result)
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> None:
+        self._finish(job_id, worker_id, "failed", {"error": error})
+
+    def _finish(self, job_id: str, worker_id: str, status: str, result: dict):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_until = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, json.dumps(result, ensure_ascii=False), job_id, worker_id),
+            )
+
+    def get_result(self, job_id: str) -> Optional[dict]:
+        """{"status": "done"|"failed", ...} для завершенного задания, иначе None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT status, result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return {"status": "failed", "error": "Задание пропало из очереди"}
+        if row[0] not in ("done", "failed"):
+            return None
+        return {"status": row[0], **json.loads(row[1] or "{}")}
+
+    def cancel(self, job_id: str) -> None:
+        """Снимает задание. Если его уже взял воркер, heartbeat вернет ему False и он прекратит рендер,
+        а записать результат ему будет некуда."""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def delete(self, job_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def requeue_expired(self) -> int:
+        with closing(self._connect()) as conn:
+            return self._requeue_expired(conn, time.time())
+
+    @staticmethod
+    def _requeue_expired(conn: sqlite3.Connection, now: float) -> int:
+        expired = conn.execute(
+            "SELECT id, worker, attempts FROM jobs WHERE status = 'running' AND lease_until < ?", (now,)
+        ).fetchall()
+        for job_id, worker_id, attempts in expired:
+            if attempts + 1 >= RENDER_MAX_ATTEMPTS:
+                logger.error(f"Задание {job_id} потеряно воркером {worker_id} {attempts + 1} раз, больше не повторяю.")
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', attempts = attempts + 1, result = ? WHERE id = ?",
+                    (json.dumps({"error": "Воркеры рендера несколько раз упали на этом задании"}, ensure_ascii=False), job_id),
+                )
+            else:
+                logger.warning(f"Аренда задания {job_id} у воркера {worker_id} истекла, возвращаю в очередь.")
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts + 1 WHERE id = ?",
+                    (job_id,),
+                )
+        return len(expired)
+
+    def register_worker(self, worker_id: str, slots: int, ttl: float = RENDER_LEASE_SECONDS) -> None:
+        """Воркер сообщает, что жив и сколько заданий ведет одновременно; без повторов за ttl считается ушедшим."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM workers WHERE alive_until < ?", (now,))
+            conn.execute("INSERT OR REPLACE INTO workers (id, slots, alive_until) VALUES (?, ?, ?)", (worker_id, slots, now + ttl))
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def capacity(self) -> int:
+        """Сумма слотов живых воркеров."""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COALESCE(SUM(slots), 0) FROM workers WHERE alive_until >= ?", (time.time(),)).fetchone()[0]
+
+
+# Все переходы состояния задания в Redis — Lua-скрипты: между взятием из очереди и выдачей аренды
+# (или между проверкой владельца и записью) не должно быть окна, в котором задание видят другие воркеры.
+# KEYS: очередь, список в работе, сроки аренды; хэш задания — render:job:<id>
+_REDIS_CLAIM = """
+local job_id = redis.call('RPOP', KEYS[1])
+if not job_id then return false end
+local key = 'render:job:' .. job_id
+local payload = redis.call('HGET', key, 'payload')
+if not payload then return {job_id, ''} end
+redis.call('LPUSH', KEYS[2], job_id)
+redis.call('ZADD', KEYS[3], ARGV[1], job_id)
+redis.call('HSET', key, 'status', 'running', 'worker', ARGV[2], 'claimed_at', ARGV[3])
+return {job_id, payload}
+"""
+_REDIS_HEARTBEAT = """
+local key = 'render:job:' .. ARGV[1]
+if redis.call('HGET', key, 'status') ~= 'running' or redis.call('HGET', key, 'worker') ~= ARGV[2] then return 0 end
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+return 1
+"""
+_REDIS_FINISH = """
+local key = 'render:job:' .. ARGV[1]
+if redis.call('HGET', key, 'status') ~= 'running' or redis.call('HGET', key, 'worker') ~= ARGV[2] then return 0 end
+redis.call('HSET', key, 'status', ARGV[3], 'result', ARGV[4])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+return 1
+"""
+# Задание удаляется отовсюду сразу: взявший его воркер получит отказ в heartbeat и прекратит рендер
+_REDIS_CANCEL = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('DEL', 'render:job:' .. ARGV[1])
+"""
+# Возвращает пары (id, 1 — вернули в очередь / 0 — попытки исчерпаны)
+_REDIS_REQUEUE = """
+local result = {}
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])) do
+    redis.call('ZREM', KEYS[3], job_id)
+    redis.call('LREM', KEYS[2], 1, job_id)
+    local key = 'render:job:' .. job_id
+    if redis.call('HINCRBY', key, 'attempts', 1) >= tonumber(ARGV[2]) then
+        redis.call('HSET', key, 'status', 'failed', 'result', ARGV[3])
+        table.insert(result, {job_id, 0})
+    else
+        redis.call('HSET', key, 'status', 'queued')
+        redis.call('HDEL', key, 'worker', 'claimed_at')
+        -- В правый конец: задание будет взято следующим
+        redis.call('RPUSH', KEYS[1], job_id)
+        table.insert(result, {job_id, 1})
+    end
+end
+return result
+"""
+
+
+class RedisBroker:
+    """Очередь — список, задания в работе — отдельный список плюс сроки аренды в sorted set."""
+
+    QUEUE = "render:queue"
+    PROCESSING = "render:processing"
+    LEASES = "render:leases"
+    WORKERS = "render:workers"  # sorted set: воркер -> срок, до которого он считается живым
+    WORKER_SLOTS = "render:worker_slots"  # хэш: воркер -> число одновременных заданий
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("Для BROKER_URL=redis://... нужен пакет redis (pip install redis).") from e
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self._claim = self.redis.register_script(_REDIS_CLAIM)
+        self._heartbeat = self.redis.register_script(_REDIS_HEARTBEAT)
+        self._finish_script = self.redis.register_script(_REDIS_FINISH)
+        self._requeue = self.redis.register_script(_REDIS_REQUEUE)
+        self._cancel = self.redis.register_script(_REDIS_CANCEL)
+
+    @property
+    def _keys(self) -> list:
+        return [self.QUEUE, self.PROCESSING, self.LEASES]
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"render:job:{job_id}"
+
+    def enqueue(self, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            "payload": json.dumps(payload, ensure_ascii=False), "status": "queued", "attempts": 0,
+        })
+        pipe.lpush(self.QUEUE, job_id)
+        pipe.execute()
+        return job_id
+
+    def claim(self, worker_id: str, lease_seconds: float = RENDER_LEASE_SECONDS) -> Optional[Tuple[str, dict]]:
+        self.requeue_expired()
+        now = time.time()
+        claimed = self._claim(keys=self._keys, args=[now + lease_seconds, worker_id, now])
+        if not claimed:
+            return None
+        job_id, payload = claimed
+        if not payload:
+            # Задание отменили, пока оно стояло в очереди
+            return None
+        return job_id, json.loads(payload)
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float = RENDER_LEASE_SECONDS) -> bool:
+        return bool(self._heartbeat(keys=self._keys, args=[job_id, worker_id, time.time() + lease_seconds]))
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> None:
+        self._finish(job_id, worker_id, "done", result)
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> None:
+        self._finish(job_id, worker_id, "failed", {"error": error})
+
+    def _finish(self, job_id: str, worker_id: str, status: str, result: dict):
+        self._finish_script(keys=self._keys, args=[job_id, worker_id, status, json.dumps(result, ensure_ascii=False)])
+
+    def get_result(self, job_id: str) -> Optional[dict]:
+        status, result = self.redis.hmget(self._key(job_id), "status", "result")
+        if status is None:
+            return {"status": "failed", "error": "Задание пропало из очереди"}
+        if status not in ("done", "failed"):
+            return None
+        return {"status": status, **json.loads(result or "{}")}
+
+    def cancel(self, job_id: str) -> None:
+        self._cancel(keys=self._keys, args=[job_id])
+
+    def delete(self, job_id: str) -> None:
+        self.redis.delete(self._key(job_id))
+
+    def requeue_expired(self) -> int:
+        error = json.dumps({"error": "Воркеры рендера несколько раз упали на этом задании"}, ensure_ascii=False)
+        expired = self._requeue(keys=self._keys, args=[time.time(), RENDER_MAX_ATTEMPTS, error])
+        for job_id, requeued in expired:
+            if requeued:
+                logger.warning(f"Аренда задания {job_id} истекла, возвращаю в очередь.")
+            else:
+                logger.error(f"Задание {job_id} потеряно воркерами {RENDER_MAX_ATTEMPTS} раз, больше не повторяю.")
+        return len(expired)
+
+    def register_worker(self, worker_id: str, slots: int, ttl: float = RENDER_LEASE_SECONDS) -> None:
+        pipe = self.redis.pipeline()
+        pipe.hset(self.WORKER_SLOTS, worker_id, slots)
+        pipe.zadd(self.WORKERS, {worker_id: time.time() + ttl})
+        pipe.execute()
+
+    def unregister_worker(self, worker_id: str) -> None:
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.WORKERS, worker_id)
+        pipe.hdel(self.WORKER_SLOTS, worker_id)
+        pipe.execute()
+
+    def capacity(self) -> int:
+        """Сумма слотов живых воркеров."""
+        now = time.time()
+        for worker_id in self.redis.zrangebyscore(self.WORKERS, "-inf", now):
+            self.unregister_worker(worker_id)
+        alive = self.redis.zrangebyscore(self.WORKERS, now, "+inf")
+        return sum(int(slots or 0) for slots in self.redis.hmget(self.WORKER_SLOTS, alive)) if alive else 0
+
+
+def get_broker(url: str = BROKER_URL):
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisBroker(url)
+    if url.startswith("sqlite:///"):
+        return SqliteBroker(url[len("sqlite:///"):])
+    raise ValueError(f"Неизвестный BROKER_URL: {url}")
+
+
+_broker = None
+
+
+def _shared_broker():
+    global _broker
+    if _broker is None:
+        _broker = get_broker()
+    return _broker
+
+
+async def generate_remote(content: dict, chosen_format: str, final_video_dir: Path, profile: RenderProfile) -> Path:
+    """То же, что pipeline.generate_video, но на воркере: папка задания лежит в общем хранилище."""
+    broker = _shared_broker()
+    job_id = await asyncio.to_thread(broker.enqueue, {
+        "content": content, "chosen_format": chosen_format,
+        "final_video_dir": str(final_video_dir), "profile": profile.name,
+    })
+    try:
+        while (result := await asyncio.to_thread(broker.get_result, job_id)) is None:
+            await asyncio.sleep(RESULT_POLL_INTERVAL)
+    except asyncio.CancelledError:
+        await asyncio.to_thread(broker.cancel, job_id)
+        raise
+    await asyncio.to_thread(broker.delete, job_id)
+    if result["status"] != "done":
+        raise BrokerError(result.get("error", "Воркер не смог создать видео"))
+    return Path(result["video_path"])
+
+
+async def follow_worker_capacity(scheduler) -> None:
+    """В remote-режиме бот отдает воркерам столько заданий сразу, сколько у них слотов.
+
+    Остальные ждут в очереди бота, где действуют ее лимит и очередность по пользователям.
+    Новые реплики воркеров подхватываются без перезапуска бота.
+    """
+    broker = _shared_broker()
+    while True:
+        try:
+            slots = await asyncio.to_thread(broker.capacity)
+            # Без живых воркеров одно задание все равно ждет в брокере, пока воркер не поднимется
+            await scheduler.set_concurrency(max(1, slots))
+        except Exception as e:
+            logger.warning(f"Не удалось узнать число слотов воркеров: {e}")
+        await asyncio.sleep(CAPACITY_POLL_INTERVAL)
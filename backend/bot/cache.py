@@ -0,0 +1,226 @@
+# cache.py
+"""Дисковый кэш артефактов конвейера с адресацией по содержимому.
+
+Ключ артефакта — хэш всех входных данных этапа, поэтому одинаковый запрос
+находит готовый результат, а частично измененный пересчитывает только те этапы,
+чьи входы изменились. Размер кэша ограничен, вытесняются давно не использованные записи.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "5120"))
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """Жесткая ссылка мгновенна и переживает вытеснение записи из кэша; копия — запасной вариант."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ArtifactCache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_MB * 1024 * 1024, evict: bool = True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        # False — у процессов, которые делят папку с владельцем кэша (воркеры рендера): вытесняет
+        # записи только владелец, а остальные не сканируют папку и подхватывают записи по одной
+        self.evict = evict
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # имя файла -> размер, от давно использованных к недавним
+        self._total_bytes = 0
+        self._written = []  # что записал не-владелец и еще не передал владельцу, см. take_written
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        if evict:
+            self._load()
+
+    @staticmethod
+    def key(stage: str, **inputs) -> str:
+        """Ключ этапа: имя этапа плюс sha256 от его входных данных."""
+        payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{stage}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str, suffix: str, dst: Path) -> Optional[Path]:
+        """При попадании кладет артефакт в dst и возвращает dst, иначе None."""
+        name = key + suffix
+        stage = key.split("-", 1)[0]
+        with self._lock:
+            self._adopt(name)
+            if name not in self._entries or not self._path(name).exists():
+                self._forget(name)
+                self.misses[stage] += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits[stage] += 1
+        path = self._path(name)
+        try:
+            os.utime(path)
+            dst.unlink(missing_ok=True)
+            _link_or_copy(path, dst)
+        except OSError:
+            # Запись вытеснили между проверкой и копированием (другой поток или процесс)
+            with self._lock:
+                self._forget(name)
+                self.hits[stage] -= 1
+                self.misses[stage] += 1
+            return None
+        return dst
+
+    def put(self, key: str, suffix: str, src: Path) -> None:
+        """Сохраняет готовый файл src под ключом key."""
+        name = key + suffix
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{name}.{threading.get_ident()}.tmp")
+        _link_or_copy(src, tmp_path)
+        os.replace(tmp_path, path)
+        self._register(name, path)
+
+    def put_bytes(self, key: str, suffix: str, data: bytes) -> None:
+        """Сохраняет артефакт, который есть только в памяти (например, потоковую озвучку)."""
+        name = key + suffix
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        self._register(name, path)
+
+    def get_bytes(self, key: str, suffix: str) -> Optional[bytes]:
+        """Содержимое артефакта целиком в памяти (небольшие сериализованные объекты) или None."""
+        name = key + suffix
+        stage = key.split("-", 1)[0]
+        with self._lock:
+            self._adopt(name)
+            if name not in self._entries:
+                self.misses[stage] += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits[stage] += 1
+        try:
+            os.utime(self._path(name))
+            return self._path(name).read_bytes()
+        except OSError:
+            with self._lock:
+                self._forget(name)
+            return None
+
+    def contains(self, key: str, suffix: str) -> bool:
+        """Проверка без учета в счетчиках попаданий."""
+        with self._lock:
+            self._adopt(key + suffix)
+            return key + suffix in self._entries
+
+    def get_value(self, key: str) -> Optional[Any]:
+        """Небольшие JSON-значения (например, длительность аудио) хранятся рядом с файлами."""
+        name = key + ".json"
+        stage = key.split("-", 1)[0]
+        with self._lock:
+            self._adopt(name)
+            if name not in self._entries:
+                self.misses[stage] += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits[stage] += 1
+        try:
+            os.utime(self._path(name))
+            return json.loads(self._path(name).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget(name)
+            return None
+
+    def put_value(self, key: str, value: Any) -> None:
+        name = key + ".json"
+        path = self._path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{name}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(value), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._register(name, path)
+
+    def take_written(self) -> List[str]:
+        """Имена файлов, записанных с прошлого вызова; их нужно передать владельцу кэша в adopt."""
+        with self._lock:
+            written, self._written = self._written, []
+        return written
+
+    def adopt(self, names: Iterable[str]) -> None:
+        """Учитывает файлы, которые другой процесс записал в папку кэша, и вытесняет лишнее."""
+        with self._lock:
+            for name in names:
+                self._forget(name)
+                self._adopt(name)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+            }
+
+    def _path(self, name: str) -> Path:
+        # Раскладываем по подпапкам, чтобы не держать тысячи файлов в одной директории
+        return self.root / name.split("-", 1)[0] / name
+
+    def _register(self, name: str, path: Path):
+        with self._lock:
+            self._forget(name)
+            size = path.stat().st_size
+            self._entries[name] = size
+            self._total_bytes += size
+            if not self.evict:
+                self._written.append(name)
+            self._evict()
+
+    def _adopt(self, name: str):
+        """Подхватывает запись, которую записал другой процесс (воркеры рендера делят одну папку)."""
+        if name in self._entries:
+            return
+        try:
+            size = self._path(name).stat().st_size
+        except OSError:
+            return
+        self._entries[name] = size
+        self._total_bytes += size
+
+    def _forget(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        if not self.evict:
+            return
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._path(name).unlink(missing_ok=True)
+            logger.info(f"Кэш: вытеснен {name} ({size} байт)")
+
+    def _load(self):
+        """Восстанавливает индекс после перезапуска; порядок LRU — по времени изменения файлов."""
+        if not self.root.exists():
+            return
+        files = [p for p in self.root.glob("*/*") if p.is_file() and not p.name.startswith(".")]
+        files.sort(key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._total_bytes += size
+        self._evict()
+        logger.info(f"Кэш артефактов: {len(self._entries)} записей, {self._total_bytes} байт.")
@@ -0,0 +1,36 @@
+# content_parser.py
+"""Разбор сообщения пользователя на озвучку, код и надписи."""
+import re
+from highlight import DEFAULT_LANGUAGE, resolve_language
+
+
+def parse_user_input(text: str) -> dict:
+    extracted_data = {"tts_text": "", "code_text": "", "top_text": "", "bottom_text": "", "language": DEFAULT_LANGUAGE}
+    text_to_process = text
+    top_match = re.search(r'!!!([\s\S]*?)!!!', text_to_process)
+    if top_match:
+        extracted_data["top_text"] = top_match.group(1).strip()
+        text_to_process = text_to_process.replace(top_match.group(0), "", 1)
+    bottom_match = re.search(r'@@([\s\S]*?)@@', text_to_process)
+    if bottom_match:
+        extracted_data["bottom_text"] = bottom_match.group(1).strip()
+        text_to_process = text_to_process.replace(bottom_match.group(0), "", 1)
+    # Тег языка — слово сразу после /// на отдельной строке: ///js\n...///
+    code_match = re.search(r'\/\/\/(?:([^\s/]+)[ \t]*\n)?([\s\S]*?)\/\/\/', text_to_process)
+    if code_match:
+        tag, code = code_match.group(1), code_match.group(2)
+        language = resolve_language(tag)
+        if language:
+            extracted_data["language"] = language
+        elif tag:
+            # Незнакомое слово — это первая строка кода, а не тег
+            code = f"{tag}\n{code}"
+        extracted_data["code_text"] = code.strip()
+        text_to_process = text_to_process.replace(code_match.group(0), "", 1)
+    extracted_data["tts_text"] = text_to_process.strip()
+    return extracted_data
+
+
+def is_complete(content: dict) -> bool:
+    """Для видео нужны хотя бы текст озвучки и код."""
+    return bool(content.get("tts_text")) and bool(content.get("code_text"))
@@ -0,0 +1,128 @@
+# delivery.py
+"""Отправка видео в Telegram: повторное использование file_id и подгонка размера.
+
+Telegram возвращает file_id для каждого загруженного файла, и по нему тот же файл можно
+отправить в любой чат без повторной загрузки. file_id хранится по sha256 содержимого
+ролика, поэтому повторный запрос или отправка того же видео в другой чат обходятся
+без загрузки. Если задан TELEGRAM_TARGET_MB, слишком большие ролики перед загрузкой
+пережимаются под этот размер.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+from telegram.error import BadRequest
+from cache import CACHE_DIR
+from media_probe import ffprobe_duration
+from pipeline import run_ffmpeg, stage
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_FILE_IDS = os.getenv("TELEGRAM_FILE_IDS", os.path.join(CACHE_DIR, "telegram_file_ids.json"))
+# Целевой размер отправляемого ролика в МБ; 0 — отправлять как есть (лимит Bot API — 50 МБ)
+TELEGRAM_TARGET_MB = float(os.getenv("TELEGRAM_TARGET_MB", "0"))
+TELEGRAM_AUDIO_KBPS = 128
+# Ниже такого битрейта картинка в полном разрешении разваливается, поэтому кадр уменьшается
+DOWNSCALE_BELOW_KBPS = 1500
+DOWNSCALE_MAX_SIDE = 1280
+MIN_VIDEO_KBPS = 200
+SEND_TIMEOUT = 120
+
+
+class FileIdRegistry:
+    """sha256 содержимого -> file_id Telegram, с сохранением в JSON."""
+
+    def __init__(self, path: str = TELEGRAM_FILE_IDS):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._ids = {}
+        if self.path.exists():
+            try:
+                self._ids = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать реестр file_id {self.path}: {e}")
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            return self._ids.get(digest)
+
+    def put(self, digest: str, file_id: str) -> None:
+        with self._lock:
+            self._ids[digest] = file_id
+            self._save()
+
+    def forget(self, digest: str) -> None:
+        with self._lock:
+            if self._ids.pop(digest, None) is not None:
+                self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        tmp_path.write_text(json.dumps(self._ids), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+file_id_registry = FileIdRegistry()
+
+
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def fit_to_size(video_path: Path, target_mb: float = TELEGRAM_TARGET_MB) -> Path:
+    """Пережимает ролик под target_mb по среднему битрейту; если он и так меньше, возвращает его же."""
+    target_bytes = target_mb * 1024 * 1024
+    if not target_mb or video_path.stat().st_size <= target_bytes:
+        return video_path
+    with stage("size_encode") as record:
+        duration = await asyncio.to_thread(ffprobe_duration, video_path)
+        # 5% запаса на контейнер и неточность rate control
+        video_kbps = max(MIN_VIDEO_KBPS, int(target_bytes * 8 * 0.95 / duration / 1000) - TELEGRAM_AUDIO_KBPS)
+        scale_args = []
+        if video_kbps < DOWNSCALE_BELOW_KBPS:
+            scale_args = ['-vf', f"scale={DOWNSCALE_MAX_SIDE}:{DOWNSCALE_MAX_SIDE}:force_original_aspect_ratio=decrease:force_divisible_by=2"]
+        output_path = video_path.with_name(f"{video_path.stem}.telegram.mp4")
+        await run_ffmpeg(
+            '-i', str(video_path), *scale_args,
+            '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', f"{video_kbps}k", '-maxrate', f"{video_kbps}k",
+            '-bufsize', f"{video_kbps * 2}k", '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', f"{TELEGRAM_AUDIO_KBPS}k", '-movflags', '+faststart', str(output_path),
+        )
+        record["bytes"] = output_path.stat().st_size
+    logger.info(f"Ролик пережат для Telegram: {video_path.stat().st_size} -> {output_path.stat().st_size} байт ({video_kbps} кбит/с).")
+    return output_path
+
+
+async def send_video(bot, chat_id: int, video_path, caption: str = None) -> int:
+    """Отправляет ролик, по возможности по сохраненному file_id; возвращает число загруженных байт."""
+    video_path = Path(video_path)
+    digest = await asyncio.to_thread(file_sha256, video_path)
+    file_id = file_id_registry.get(digest)
+    if file_id:
+        try:
+            await bot.send_video(chat_id=chat_id, video=file_id, caption=caption)
+            return 0
+        except BadRequest as e:
+            # file_id мог устареть (например, бот пересоздан) — загружаем заново
+            logger.warning(f"file_id для {video_path.name} не принят Telegram: {e}")
+            file_id_registry.forget(digest)
+
+    upload_path = await fit_to_size(video_path)
+    video_bytes = await asyncio.to_thread(upload_path.read_bytes)
+    message = await bot.send_video(
+        chat_id=chat_id, video=video_bytes, filename=video_path.name, caption=caption,
+        supports_streaming=True, read_timeout=SEND_TIMEOUT, write_timeout=SEND_TIMEOUT,
+    )
+    attachment = (message.video or message.document) if message else None
+    if attachment:
+        await asyncio.to_thread(file_id_registry.put, digest, attachment.file_id)
+    return len(video_bytes)
@@ -0,0 +1,70 @@
+# highlight.py
+"""Подсветка кода Pygments вне рендереров.
+
+Код разбивается на токены один раз в конвейере (результат кэшируется, см. pipeline),
+а рендерер получает готовые строки из пар (текст, цвет) и только собирает из них
+Pango-разметку. Модуль не зависит от manim, поэтому его можно импортировать и в боте.
+"""
+import os
+from typing import List, Optional, Tuple
+from pygments.lexers import get_lexer_by_name
+from pygments.styles import get_style_by_name
+from pygments.util import ClassNotFound
+
+DEFAULT_LANGUAGE = "python"
+CODE_STYLE = os.getenv("CODE_STYLE", "vim")
+TAB_WIDTH = 4
+
+# Строка кода — список пар (текст, цвет "#rrggbb"); списки, а не кортежи, чтобы пережить JSON
+TokenLine = List[List[str]]
+
+
+def resolve_language(tag: str) -> Optional[str]:
+    """Каноническое имя языка Pygments для тега (py -> python, js -> javascript) или None."""
+    if not tag:
+        return None
+    try:
+        return get_lexer_by_name(tag.lower()).aliases[0]
+    except ClassNotFound:
+        return None
+
+
+def tokenize(code: str, language: str = DEFAULT_LANGUAGE, style: str = CODE_STYLE) -> List[TokenLine]:
+    """Строки кода с цветами токенов; соседние токены одного цвета склеиваются."""
+    try:
+        lexer = get_lexer_by_name(language, tabsize=TAB_WIDTH, stripnl=False)
+    except ClassNotFound:
+        lexer = get_lexer_by_name(DEFAULT_LANGUAGE, tabsize=TAB_WIDTH, stripnl=False)
+    style_cls = get_style_by_name(style)
+    colors = {}
+
+    def color_for(token_type) -> str:
+        if token_type not in colors:
+            # Цвет наследуется от родительского типа токена, у vim базовый — #cccccc
+            color = style_cls.style_for_token(token_type)["color"] or "cccccc"
+            colors[token_type] = f"#{color}"
+        return colors[token_type]
+
+    lines: List[TokenLine] = [[]]
+    for token_type, value in lexer.get_tokens(code):
+        color = color_for(token_type)
+        for i, part in enumerate(value.split("\n")):
+            if i:
+                lines.append([])
+            if not part:
+                continue
+            line = lines[-1]
+            if line and line[-1][1] == color:
+                line[-1][0] += part
+            else:
+                line.append([part, color])
+    # Лексер всегда добавляет перевод строки в конце
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def paginate(lines: List[TokenLine], lines_per_page: int) -> List[Tuple[int, List[TokenLine]]]:
+    """Страницы по lines_per_page строк: (номер первой строки с 1, строки)."""
+    lines_per_page = max(1, lines_per_page)
+    return [(start + 1, lines[start:start + lines_per_page]) for start in range(0, max(len(lines), 1), lines_per_page)]
@@ -0,0 +1,47 @@
+# loop_monitor.py
+"""Замер задержки event loop: показывает, не блокирует ли что-то бота."""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+LOOP_LAG_REPORT_EVERY = int(os.getenv("LOOP_LAG_REPORT_EVERY", "600"))  # в замерах
+
+
+class LoopLagMonitor:
+    """Периодически засыпает на interval и смотрит, насколько позже loop его разбудил."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, warn_ms: float = LOOP_LAG_WARN_MS):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        window_max = 0.0
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - started - self.interval) * 1000)
+            self.last_ms = lag_ms
+            self.max_ms = max(self.max_ms, lag_ms)
+            self.samples += 1
+            window_max = max(window_max, lag_ms)
+            if lag_ms > self.warn_ms:
+                logger.warning(f"Event loop заблокирован на {lag_ms:.0f} мс")
+            if self.samples % LOOP_LAG_REPORT_EVERY == 0:
+                logger.info(f"Задержка event loop: максимум за период {window_max:.1f} мс, за все время {self.max_ms:.1f} мс")
+                window_max = 0.0
@@ -0,0 +1,193 @@
+# media_probe.py
+"""Быстрое определение длительности аудио без декодирования.
+
+Длительность MP3 считается по заголовкам фреймов: каждый фрейм несет фиксированное
+число сэмплов, а его длина вычисляется из битрейта, так что payload можно пропускать.
+AAC в ADTS устроен так же: длина фрейма записана прямо в заголовке.
+Память постоянная, поток можно подавать кусками прямо по мере прихода от TTS.
+"""
+import logging
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_BITRATES = {  # (версия MPEG 1 или 2, слой) -> кбит/с по индексу 1..14
+    (1, 1): (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),   # MPEG 2.5
+}
+
+
+def parse_frame_header(header: bytes) -> Optional[tuple]:
+    """Разбирает 4 байта заголовка MPEG-фрейма; возвращает (длина фрейма, сэмплов, частота) или None."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    version = 1 if version_bits == 3 else 2
+    bitrate = _BITRATES[(version, layer)][bitrate_index - 1] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 1152 if layer == 2 or version == 1 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+class Mp3DurationCounter:
+    """Считает длительность MP3-потока по заголовкам фреймов, получая данные кусками."""
+
+    def __init__(self):
+        self.samples = 0
+        self.sample_rate = 0
+        self.frames = 0
+        self.xing_frames = None  # число фреймов из заголовка Xing/Info, если он есть
+        self.samples_per_frame = 0
+        self._buf = b""  # хвост предыдущего куска, не длиннее одного заголовка
+        self._skip = 0
+        self._tag_checked = False
+        self._first_frame = True
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    def feed(self, chunk: bytes) -> None:
+        if self._skip >= len(chunk) and not self._buf:
+            self._skip -= len(chunk)
+            return
+        data = self._buf + chunk if self._buf else chunk
+        # Идем по данным смещением, чтобы не копировать буфер на каждом фрейме
+        pos, self._skip = self._skip, 0
+        while True:
+            if pos >= len(data):
+                self._skip = pos - len(data)
+                self._buf = b""
+                return
+            if not self._tag_checked:
+                if len(data) - pos < 10:
+                    break
+                self._tag_checked = True
+                if data[pos:pos + 3] == b"ID3":
+                    # Размер ID3v2 записан в syncsafe-формате, плюс 10 байт заголовка и, возможно, футер
+                    size = (data[pos + 6] << 21) | (data[pos + 7] << 14) | (data[pos + 8] << 7) | data[pos + 9]
+                    pos += size + (20 if data[pos + 5] & 0x10 else 10)
+                    continue
+            if len(data) - pos < 4:
+                break
+            parsed = parse_frame_header(data[pos:pos + 4])
+            if parsed is None:
+                # Мусор или ID3v1 в конце: ищем следующий возможный синхрокод
+                next_sync = data.find(b"\xff", pos + 1)
+                pos = next_sync if next_sync >= 0 else len(data)
+                continue
+            frame_length, samples, sample_rate = parsed
+            if self._first_frame:
+                # Первый фрейм может быть служебным Xing/Info/VBRI без звука
+                if len(data) - pos < min(frame_length, 64):
+                    break
+                self._first_frame = False
+                head = data[pos:pos + 64]
+                xing_pos = max(head.find(b"Xing"), head.find(b"Info"))
+                if xing_pos >= 0 or b"VBRI" in head:
+                    if xing_pos >= 0 and xing_pos + 12 <= len(head) and head[xing_pos + 7] & 0x01:
+                        self.xing_frames = int.from_bytes(head[xing_pos + 8:xing_pos + 12], "big")
+                    self.sample_rate = sample_rate
+                    self.samples_per_frame = samples
+                    pos += frame_length
+                    continue
+            self.frames += 1
+            self.samples += samples
+            self.sample_rate = sample_rate
+            pos += frame_length
+        self._buf = data[pos:]
+
+
+_ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+
+class AdtsDurationCounter:
+    """Считает длительность потока AAC (ADTS) по заголовкам фреймов, получая данные кусками."""
+
+    def __init__(self):
+        self.samples = 0
+        self.sample_rate = 0
+        self.frames = 0
+        self._buf = b""
+        self._skip = 0
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    def feed(self, chunk: bytes) -> None:
+        if self._skip >= len(chunk) and not self._buf:
+            self._skip -= len(chunk)
+            return
+        data = self._buf + chunk if self._buf else chunk
+        pos, self._skip = self._skip, 0
+        while True:
+            if pos >= len(data):
+                self._skip = pos - len(data)
+                self._buf = b""
+                return
+            if len(data) - pos < 7:
+                break
+            header = data[pos:pos + 7]
+            frame_length = ((header[3] & 0x03) << 11) | (header[4] << 3) | (header[5] >> 5)
+            sample_rate_index = (header[2] >> 2) & 0x0F
+            if header[0] != 0xFF or (header[1] & 0xF6) != 0xF0 or frame_length < 7 or sample_rate_index >= len(_ADTS_SAMPLE_RATES):
+                next_sync = data.find(b"\xff", pos + 1)
+                pos = next_sync if next_sync >= 0 else len(data)
+                continue
+            # В фрейме 1-4 блока по 1024 сэмпла
+            self.frames += 1
+            self.samples += 1024 * ((header[6] & 0x03) + 1)
+            self.sample_rate = _ADTS_SAMPLE_RATES[sample_rate_index]
+            pos += frame_length
+        self._buf = data[pos:]
+
+
+def mp3_duration(path, chunk_size: int = 64 * 1024) -> Optional[float]:
+    """Длительность MP3-файла по заголовкам фреймов или None, если файл не похож на MP3."""
+    counter = Mp3DurationCounter()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            counter.feed(chunk)
+            if counter.xing_frames is not None:
+                # В заголовке Xing число фреймов записано заранее, дочитывать файл не нужно
+                return counter.xing_frames * counter.samples_per_frame / counter.sample_rate
+    return counter.duration if counter.frames else None
+
+
+def ffprobe_duration(path) -> float:
+    """Длительность по метаданным контейнера через ffprobe (без декодирования)."""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)],
+        check=True, capture_output=True, text=True,
+    )
+    return float(result.stdout.strip())
+
+
+def probe_duration(path) -> float:
+    """Длительность аудиофайла: сначала по заголовкам MP3, иначе через ffprobe."""
+    if Path(path).suffix.lower() == ".mp3":
+        duration = mp3_duration(path)
+        if duration:
+            return duration
+        logger.warning(f"Не удалось разобрать MP3-заголовки {path}, использую ffprobe.")
+    return ffprobe_duration(path)
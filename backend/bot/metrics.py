@@ -0,0 +1,97 @@
+# metrics.py
+"""Метрики Prometheus и структурированный лог этапов генерации.
+
+Этапы конвейера и обработчиков бота замеряются через pipeline.stage; здесь их записи
+превращаются в гистограммы и счетчики. Состояние кэша, очереди и event loop читается
+в момент запроса /metrics. HTTP-сервер поднимается, только если задан METRICS_PORT.
+"""
+import json
+import logging
+import os
+from prometheus_client import Counter, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import pipeline
+from pipeline import stage_listeners
+from render_queue import RenderScheduler
+from loop_monitor import LoopLagMonitor
+
+logger = logging.getLogger(__name__)
+span_logger = logging.getLogger("spans")
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 — эндпоинт выключен
+# Каждый этап одной строкой JSON в лог (задание, время, CPU, байты, попадание в кэш)
+SPAN_LOG = os.getenv("SPAN_LOG", "0") == "1"
+
+# От долей секунды (кэш, пробы) до десяти минут (высокое качество с длинной очередью)
+_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "codevideo_stage_seconds", "Длительность этапа генерации", ["stage", "outcome"], buckets=_BUCKETS,
+)
+STAGE_CPU_SECONDS = Counter(
+    "codevideo_stage_cpu_seconds", "CPU процесса бота и ffmpeg по этапам", ["stage"],
+)
+RENDER_WORKER_CPU_SECONDS = Counter("codevideo_render_worker_cpu_seconds", "CPU воркеров Manim")
+TIME_TO_VIDEO_SECONDS = Histogram(
+    "codevideo_time_to_video_seconds", "От нажатия кнопки до отправленного в чат видео",
+    ["profile", "outcome"], buckets=_BUCKETS,
+)
+QUEUE_WAIT_SECONDS = Histogram("codevideo_queue_wait_seconds", "Ожидание в очереди рендера", buckets=_BUCKETS)
+RENDER_FAILURES = Counter("codevideo_render_failures", "Неудачные рендеры Manim")
+STAGE_BYTES = Counter("codevideo_stage_bytes", "Байты, полученные или отданные этапом", ["stage"])
+
+
+def record_stage(name: str, record: dict) -> None:
+    """Слушатель pipeline.stage."""
+    outcome = "ok" if record["ok"] else "error"
+    if name == "time_to_video":
+        TIME_TO_VIDEO_SECONDS.labels(record.get("profile", "unknown"), outcome).observe(record["wall_s"])
+    else:
+        STAGE_SECONDS.labels(name, outcome).observe(record["wall_s"])
+        STAGE_CPU_SECONDS.labels(name).inc(max(record["cpu_s"], 0.0))
+    if "worker_cpu_s" in record:
+        RENDER_WORKER_CPU_SECONDS.inc(record["worker_cpu_s"])
+    if name == "manim" and not record["ok"]:
+        RENDER_FAILURES.inc()
+    if record.get("bytes"):
+        STAGE_BYTES.labels(name).inc(record["bytes"])
+    if record.get("tts_bytes"):
+        STAGE_BYTES.labels("tts").inc(record["tts_bytes"])
+    if SPAN_LOG:
+        span_logger.info(json.dumps({"span": name, **record}, ensure_ascii=False, default=str))
+
+
+class _StateCollector:
+    """Значения, которые и так хранятся в объектах бота: читаем их при каждом опросе."""
+
+    def __init__(self, scheduler: RenderScheduler, loop_monitor: LoopLagMonitor):
+        self.scheduler = scheduler
+        self.loop_monitor = loop_monitor
+
+    def collect(self):
+        # Кэш открывается в main(), уже после импорта этого модуля
+        stats = pipeline.artifact_cache.stats()
+        hits = CounterMetricFamily("codevideo_cache_hits", "Попадания в кэш артефактов", labels=["stage"])
+        misses = CounterMetricFamily("codevideo_cache_misses", "Промахи кэша артефактов", labels=["stage"])
+        for stage_name, count in stats["hits"].items():
+            hits.add_metric([stage_name], count)
+        for stage_name, count in stats["misses"].items():
+            misses.add_metric([stage_name], count)
+        yield hits
+        yield misses
+        yield GaugeMetricFamily("codevideo_cache_bytes", "Размер кэша артефактов", value=stats["bytes"])
+        yield GaugeMetricFamily("codevideo_cache_entries", "Записей в кэше артефактов", value=stats["entries"])
+        yield GaugeMetricFamily("codevideo_queue_waiting", "Заданий в очереди рендера", value=self.scheduler.waiting)
+        yield GaugeMetricFamily("codevideo_queue_running", "Заданий в работе", value=self.scheduler.running)
+        yield GaugeMetricFamily("codevideo_loop_lag_seconds", "Последняя задержка event loop", value=self.loop_monitor.last_ms / 1000)
+        yield GaugeMetricFamily("codevideo_loop_lag_max_seconds", "Максимальная задержка event loop", value=self.loop_monitor.max_ms / 1000)
+
+
+def setup_metrics(scheduler: RenderScheduler, loop_monitor: LoopLagMonitor) -> None:
+    """Подключает метрики к конвейеру и очереди и, если задан METRICS_PORT, поднимает /metrics."""
+    stage_listeners.append(record_stage)
+    scheduler.wait_listeners.append(QUEUE_WAIT_SECONDS.observe)
+    REGISTRY.register(_StateCollector(scheduler, loop_monitor))
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        logger.info(f"Метрики Prometheus: http://0.0.0.0:{METRICS_PORT}/metrics")
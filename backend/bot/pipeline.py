@@ -0,0 +1,451 @@
+# pipeline.py
+"""Конвейер генерации видео: озвучка, рендер Manim и склейка в ffmpeg."""
+import asyncio
+import logging
+import math
+import os
+import resource
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import AsyncIterator, Callable, List, Optional
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from render_pool import RenderPool, RenderJob
+from highlight import CODE_STYLE, DEFAULT_LANGUAGE, tokenize
+from cache import ArtifactCache
+from media_probe import probe_duration, ffprobe_duration, AdtsDurationCounter, Mp3DurationCounter
+from render_profiles import RenderProfile, DEFAULT_PROFILE
+
+load_dotenv()
+TTS_MODEL = os.getenv("TTS_MODEL", "tts-1")
+TTS_VOICE = os.getenv("TTS_VOICE", "alloy")
+TTS_FORMAT = os.getenv("TTS_FORMAT", "mp3")
+# Потоковый режим: байты TTS идут в stdin ffmpeg без промежуточного файла
+TTS_STREAMING = os.getenv("TTS_STREAMING", "0") == "1"
+# Формат TTS -> (как ffmpeg читает озвучку, как звук попадает в mp4). Демультиплексор задается
+# явно: из stdin формат не угадывается. aac (ADTS) копируется в mp4, остальное перекодируется в AAC;
+# pcm у OpenAI — 16-битный little-endian, 24 кГц, моно
+TTS_FORMATS = {
+    "mp3": (['-f', 'mp3'], ['-c:a', 'aac']),
+    "aac": (['-f', 'aac'], ['-c:a', 'copy']),
+    "opus": (['-f', 'ogg'], ['-c:a', 'aac']),
+    "flac": (['-f', 'flac'], ['-c:a', 'aac']),
+    "wav": (['-f', 'wav'], ['-c:a', 'aac']),
+    "pcm": (['-f', 's16le', '-ar', '24000', '-ac', '1'], ['-c:a', 'aac']),
+}
+PCM_BYTES_PER_SECOND = 24000 * 2
+# Форматы, длительность которых считается по заголовкам фреймов прямо во время загрузки
+DURATION_COUNTERS = {"mp3": Mp3DurationCounter, "aac": AdtsDurationCounter}
+if TTS_FORMAT not in TTS_FORMATS:
+    raise ValueError(f"Неподдерживаемый TTS_FORMAT: {TTS_FORMAT}. Допустимые значения: {', '.join(TTS_FORMATS)}")
+AUDIO_INPUT_ARGS, AUDIO_CODEC_ARGS = TTS_FORMATS[TTS_FORMAT]
+# Статичный хвост собирается из повторов короткого сегмента; без известной длины озвучки
+# (потоковый режим) повторов берется с запасом, а лишнее обрезает -shortest
+HOLD_SEGMENT_SECONDS = 1
+MAX_HOLD_SECONDS = int(os.getenv("MAX_HOLD_SECONDS", "900"))
+# Подписи рендерятся один раз в прозрачный PNG и накладываются ffmpeg вместо отрисовки в каждом кадре
+CAPTION_LAYER = os.getenv("CAPTION_LAYER", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_client() -> AsyncOpenAI:
+    """Клиент OpenAI создается при первом обращении, когда токены уже проверены."""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+# Пул рендереров Manim, запускается в bot.main()
+render_pool = RenderPool()
+# Кэш озвучки, видеоряда и финальных роликов открывается в main() процесса-владельца (open_artifact_cache).
+# Воркеры пула (forkserver) заново импортируют главный модуль, а с ним и этот, и не должны ни сканировать
+# папку кэша, ни вытеснять из нее по своему снимку
+artifact_cache: Optional[ArtifactCache] = None
+
+
+def open_artifact_cache() -> ArtifactCache:
+    global artifact_cache
+    if artifact_cache is None:
+        artifact_cache = ArtifactCache()
+    return artifact_cache
+
+
+# Слушатели замеров этапов (бенчмарки, метрики): вызываются с именем этапа и его записью
+StageListener = Callable[[str, dict], None]
+stage_listeners: List[StageListener] = []
+# Идентификатор задания (имя папки), которым помечаются записи этапов; задачи asyncio наследуют его
+current_job: ContextVar = ContextVar("current_job", default="")
+
+
+def _cpu_seconds() -> float:
+    # Процесс бота плюс уже завершившиеся дочерние процессы (ffmpeg)
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+@contextmanager
+def stage(name: str):
+    """Замеряет этап и передает запись слушателям; этап может дописать в нее свои поля.
+
+    cpu_s считается по всему процессу, поэтому при нескольких заданиях сразу он включает
+    и чужую работу; CPU рендера Manim приходит отдельно от воркера (worker_cpu_s).
+    """
+    record = {"ok": True, "job": current_job.get()}
+    started, cpu_started = time.perf_counter(), _cpu_seconds()
+    try:
+        yield record
+    except BaseException:
+        record["ok"] = False
+        raise
+    finally:
+        record["wall_s"] = time.perf_counter() - started
+        record["cpu_s"] = _cpu_seconds() - cpu_started
+        for listener in stage_listeners:
+            try:
+                listener(name, record)
+            except Exception:
+                logger.exception(f"Ошибка слушателя замеров этапа {name}")
+
+
+def resolution_for(chosen_format: str) -> tuple:
+    return (1080, 1920) if chosen_format == "9:16" else (1920, 1080)
+
+
+async def run_ffmpeg(*args: str, stdin_chunks: Optional[AsyncIterator[bytes]] = None) -> None:
+    """Запускает ffmpeg, не блокируя event loop; при ошибке выбрасывает исключение с его stderr.
+
+    Если передан stdin_chunks, его байты подаются ffmpeg на stdin (вход 'pipe:0').
+    """
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-y', *args,
+        stdin=asyncio.subprocess.PIPE if stdin_chunks is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    if stdin_chunks is None:
+        _, stderr = await process.communicate()
+    else:
+        stderr_task = asyncio.create_task(process.stderr.read())
+        try:
+            async for chunk in stdin_chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg завершился раньше времени, причину покажет код возврата
+        except BaseException:
+            process.kill()
+            await process.wait()
+            raise
+        finally:
+            process.stdin.close()
+        stderr = await stderr_task
+        await process.wait()
+    if process.returncode != 0:
+        raise Exception(f"FFmpeg завершился с ошибкой: {stderr.decode(errors='replace')[-2000:]}")
+
+
+async def _synthesize_speech(text: str, audio_path: Path):
+    async with get_client().audio.speech.with_streaming_response.create(
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        input=text,
+        response_format=TTS_FORMAT,
+    ) as response:
+        await response.stream_to_file(audio_path)
+
+
+class _SpeechStream:
+    """Озвучка, которая копится в памяти, пока идет рендер, а затем отдается в stdin ffmpeg."""
+
+    def __init__(self, text: str):
+        self.chunks = []
+        counter_class = DURATION_COUNTERS.get(TTS_FORMAT)
+        self.duration_counter = counter_class() if counter_class else None
+        self._queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._download(text))
+
+    async def _download(self, text: str):
+        try:
+            async with get_client().audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=TTS_VOICE,
+                input=text,
+                response_format=TTS_FORMAT,
+            ) as response:
+                async for chunk in response.iter_bytes():
+                    self.chunks.append(chunk)
+                    if self.duration_counter:
+                        self.duration_counter.feed(chunk)
+                    self._queue.put_nowait(chunk)
+        finally:
+            self._queue.put_nowait(None)
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Длительность, если озвучка уже загружена целиком и ее формат считается по фреймам, иначе None."""
+        if not self.task.done() or self.task.cancelled() or self.task.exception():
+            return None
+        if self.duration_counter and self.duration_counter.frames:
+            return self.duration_counter.duration
+        return None
+
+    async def __aiter__(self):
+        while (chunk := await self._queue.get()) is not None:
+            yield chunk
+        await self.task  # пробрасываем ошибку TTS, если она была
+
+
+async def _speech_stage(content: dict, tts_key: str, audio_path: Path) -> float:
+    """Озвучка и ее длительность в секундах."""
+    with stage("tts") as record:
+        record["cached"] = bool(await asyncio.to_thread(artifact_cache.get, tts_key, audio_path.suffix, audio_path))
+        if record["cached"]:
+            logger.info("Аудио взято из кэша.")
+        else:
+            logger.info("Генерация аудио...")
+            await _synthesize_speech(content["tts_text"], audio_path)
+            record["bytes"] = audio_path.stat().st_size
+            await asyncio.to_thread(artifact_cache.put, tts_key, audio_path.suffix, audio_path)
+
+    # === Вычисляем длительность аудиофайла ===
+    with stage("probe") as record:
+        audio_duration = await asyncio.to_thread(artifact_cache.get_value, tts_key)
+        record["cached"] = audio_duration is not None
+        if audio_duration is None:
+            # Длительность по заголовкам MP3-фреймов (без декодирования) или метаданным ffprobe;
+            # у сырого pcm метаданных нет, но длительность следует из размера
+            if TTS_FORMAT == "pcm":
+                audio_duration = audio_path.stat().st_size / PCM_BYTES_PER_SECOND
+            else:
+                audio_duration = await asyncio.to_thread(probe_duration, audio_path)
+            await asyncio.to_thread(artifact_cache.put_value, tts_key, audio_duration)
+    return audio_duration
+
+
+async def _render_stage(content: dict, resolution: tuple, profile: RenderProfile, video_key: str, final_video_dir: Path) -> tuple:
+    """Видеоряд без звука: сегмент с анимацией и статичный сегмент из ее последнего кадра."""
+    segments_key = artifact_cache.key("segments", video=video_key, encoder=profile.encoder_args())
+    anim_segment = final_video_dir / f"anim_{profile.name}.ts"
+    still_segment = final_video_dir / f"still_{profile.name}.ts"
+    if (artifact_cache.contains(segments_key, ".anim.ts") and artifact_cache.contains(segments_key, ".still.ts")
+            and await asyncio.to_thread(artifact_cache.get, segments_key, ".anim.ts", anim_segment)
+            and await asyncio.to_thread(artifact_cache.get, segments_key, ".still.ts", still_segment)):
+        logger.info("Сегменты видеоряда взяты из кэша.")
+        return anim_segment, still_segment
+
+    manim_output_file, caption_layer = await _manim_stage(content, resolution, profile, video_key, final_video_dir)
+    with stage("segments"):
+        await _build_segments(manim_output_file, caption_layer, profile, anim_segment, still_segment)
+    await asyncio.to_thread(artifact_cache.put, segments_key, ".anim.ts", anim_segment)
+    await asyncio.to_thread(artifact_cache.put, segments_key, ".still.ts", still_segment)
+    return anim_segment, still_segment
+
+
+async def _build_segments(manim_output_file: Path, caption_layer: Optional[Path], profile: RenderProfile,
+                          anim_segment: Path, still_segment: Path):
+    """Кодирует анимацию и секундный стоп-кадр одинаковыми настройками, чтобы их можно было склеить без перекодирования.
+
+    Стоимость не зависит от длины озвучки: сколько бы ни длился хвост, кадры для него
+    не рендерятся и не кодируются, а копируются из одного и того же сегмента.
+    Слой с подписями, если он есть, накладывается здесь же на оба сегмента.
+    """
+    encoder_args = ['-c:v', 'libx264', *profile.encoder_args(), '-pix_fmt', 'yuv420p', '-r', str(profile.frame_rate), '-an', '-f', 'mpegts']
+    last_frame = still_segment.with_suffix(".png")
+    overlay_input = ['-i', str(caption_layer)] if caption_layer else []
+    overlay_args = ['-filter_complex', '[0:v][1:v]overlay=0:0'] if caption_layer else []
+
+    async def build_still():
+        await run_ffmpeg('-sseof', '-0.5', '-i', str(manim_output_file), '-update', '1', str(last_frame))
+        await run_ffmpeg(
+            '-loop', '1', '-framerate', str(profile.frame_rate), '-i', str(last_frame), *overlay_input,
+            '-t', str(HOLD_SEGMENT_SECONDS), *overlay_args, *encoder_args, str(still_segment),
+        )
+
+    await asyncio.gather(
+        run_ffmpeg('-i', str(manim_output_file), *overlay_input, *overlay_args, *encoder_args, str(anim_segment)),
+        build_still(),
+    )
+
+
+def _language(content: dict) -> str:
+    return content.get("language") or DEFAULT_LANGUAGE
+
+
+async def _highlight_stage(content: dict) -> list:
+    """Подсветка кода считается здесь, а не в рендерере, и кэшируется отдельно от видеоряда."""
+    with stage("highlight") as record:
+        tokens_key = artifact_cache.key("tokens", code=content["code_text"], language=_language(content), style=CODE_STYLE)
+        tokens = await asyncio.to_thread(artifact_cache.get_value, tokens_key)
+        record["cached"] = tokens is not None
+        if tokens is None:
+            tokens = await asyncio.to_thread(tokenize, content["code_text"], _language(content))
+            await asyncio.to_thread(artifact_cache.put_value, tokens_key, tokens)
+    return tokens
+
+
+async def _manim_stage(content: dict, resolution: tuple, profile: RenderProfile, video_key: str, final_video_dir: Path) -> tuple:
+    """Анимация кода без звука и без статичного хвоста и, в режиме CAPTION_LAYER, PNG-слой подписей (или None)."""
+    output_name = f"video_only_{profile.name}"
+    caption_layer = final_video_dir / f"captions_{profile.name}.png"
+    # В режиме CAPTION_LAYER подписей в самом mp4 нет: без PNG-слоя (записи вытесняются независимо)
+    # ролик вышел бы без них, поэтому такой видеоряд считается промахом и рендерится заново
+    needs_layer = CAPTION_LAYER and bool(content["top_text"] or content["bottom_text"])
+    layer_cached = not needs_layer or await asyncio.to_thread(artifact_cache.get, video_key, ".captions.png", caption_layer)
+    manim_output_file = layer_cached and await asyncio.to_thread(
+        artifact_cache.get, video_key, ".mp4", final_video_dir / f"{output_name}.mp4")
+    if manim_output_file:
+        logger.info("Видеоряд взят из кэша.")
+        return manim_output_file, caption_layer if needs_layer else None
+    if not layer_cached:
+        logger.info("Слой подписей вытеснен из кэша, видеоряд рендерится заново.")
+
+    tokens = await _highlight_stage(content)
+    # Генерация видеоряда Manim в пуле прогретых рендереров
+    with stage("manim") as record:
+        path, usage, cache_files = await render_pool.render_with_usage(RenderJob(
+            code_text=content["code_text"],
+            top_text=content["top_text"],
+            bottom_text=content["bottom_text"],
+            resolution=resolution,
+            frame_rate=profile.frame_rate,
+            media_dir=str(final_video_dir / "media"),
+            output_name=output_name,
+            caption_layer_path=str(caption_layer) if CAPTION_LAYER else "",
+            language=_language(content),
+            tokens=tokens,
+        ))
+        record.update({f"worker_{name}": value for name, value in usage.items()})
+        # Раскладки и подписи, которые рендерер дописал в папку кэша, учитываются в ее размере
+        await asyncio.to_thread(artifact_cache.adopt, cache_files)
+    with stage("discovery") as record:
+        manim_output_file = Path(path)
+        if not manim_output_file.exists():
+            raise Exception(f"Не удалось найти видеофайл Manim: {manim_output_file}")
+        record["bytes"] = manim_output_file.stat().st_size
+        # PNG-слоя нет, если у ролика нет подписей
+        if CAPTION_LAYER and caption_layer.exists():
+            await asyncio.to_thread(artifact_cache.put, video_key, ".captions.png", caption_layer)
+        else:
+            caption_layer = None
+        await asyncio.to_thread(artifact_cache.put, video_key, ".mp4", manim_output_file)
+    return manim_output_file, caption_layer
+
+
+def _write_concat_list(segments: tuple, audio_duration: Optional[float]) -> Path:
+    anim_segment, still_segment = segments
+    hold_seconds = audio_duration if audio_duration else MAX_HOLD_SECONDS
+    repeats = math.ceil(hold_seconds / HOLD_SEGMENT_SECONDS) + 1
+    concat_list = anim_segment.with_suffix(".concat.txt")
+    lines = [f"file '{anim_segment.resolve()}'"] + [f"file '{still_segment.resolve()}'"] * repeats
+    concat_list.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return concat_list
+
+
+async def _mux_args(segments: tuple, audio_input: list, final_video_path: Path, audio_duration: Optional[float] = None) -> list:
+    """Склейка: анимация и повторы стоп-кадра копируются как есть.
+
+    Ролик длится max(анимация, озвучка): длинный код идет несколькими страницами, и если
+    озвучка короче, она дополняется тишиной (apad), а не обрезает последние страницы.
+    """
+    concat_list = await asyncio.to_thread(_write_concat_list, segments, audio_duration)
+    anim_duration = await asyncio.to_thread(ffprobe_duration, segments[0])
+    if audio_duration and audio_duration >= anim_duration:
+        audio_args = AUDIO_CODEC_ARGS
+    else:
+        # Озвучка короче анимации или ее длина еще неизвестна (потоковый режим): дополняем тишиной
+        # до длины анимации; более длинную озвучку в потоковом режиме -shortest не обрежет
+        audio_args = ['-af', f"apad=whole_dur={anim_duration:.3f}", '-c:a', 'aac']
+    length_args = ['-t', f"{max(audio_duration, anim_duration):.3f}"] if audio_duration else ['-shortest']
+    return [
+        '-f', 'concat', '-safe', '0', '-i', str(concat_list), *audio_input,
+        '-map', '0:v', '-map', '1:a', *length_args,
+        '-c:v', 'copy', *audio_args, '-movflags', '+faststart', str(final_video_path),
+    ]
+
+
+def output_path(final_video_dir: Path, profile: RenderProfile) -> Path:
+    """Черновое превью и финальное видео одного задания лежат рядом под разными именами."""
+    return final_video_dir / ("preview.mp4" if profile.name == "draft" else "final_video.mp4")
+
+
+async def generate_video(content: dict, chosen_format: str, final_video_dir: Path,
+                         profile: RenderProfile = DEFAULT_PROFILE) -> Path:
+    """Создает видео в final_video_dir по профилю рендера и возвращает путь к нему.
+
+    Озвучка и рендер анимации идут параллельно; статичный хвост под длину озвучки
+    собирается в ffmpeg из повторов сегмента со стоп-кадром. Каждый этап сначала ищет
+    свой результат в кэше артефактов по хэшу входных данных.
+    """
+    audio_path = final_video_dir / f"audio.{TTS_FORMAT}"
+    final_video_path = output_path(final_video_dir, profile)
+    resolution = profile.resolution(resolution_for(chosen_format))
+
+    # Ключи этапов: озвучка — текст, голос, модель и формат; видеоряд — код, его язык и стиль подсветки,
+    # надписи, разрешение, fps и способ вывода подписей; склейка — оба ключа и настройки кодировщика
+    tts_key = artifact_cache.key("tts", text=content["tts_text"], voice=TTS_VOICE, model=TTS_MODEL, format=TTS_FORMAT)
+    video_key = artifact_cache.key(
+        "manim", code=content["code_text"], language=_language(content), style=CODE_STYLE,
+        top=content["top_text"], bottom=content["bottom_text"],
+        resolution=resolution, frame_rate=profile.frame_rate, caption_layer=CAPTION_LAYER,
+    )
+    # length: ролики, собранные до того, как длина стала учитывать анимацию, могли обрезать страницы кода
+    final_key = artifact_cache.key("mux", tts=tts_key, video=video_key, encoder=profile.encoder_args(), length="max")
+    if await asyncio.to_thread(artifact_cache.get, final_key, ".mp4", final_video_path):
+        logger.info(f"Финальное видео взято из кэша: {final_video_path}")
+        return final_video_path
+
+    if TTS_STREAMING and not artifact_cache.contains(tts_key, audio_path.suffix):
+        await _stream_to_encoder(content, resolution, profile, tts_key, video_key, final_video_dir, final_video_path)
+    else:
+        speech_task = asyncio.create_task(_speech_stage(content, tts_key, audio_path))
+        render_task = asyncio.create_task(_render_stage(content, resolution, profile, video_key, final_video_dir))
+        try:
+            audio_duration, segments = await asyncio.gather(speech_task, render_task)
+        except BaseException:
+            speech_task.cancel()
+            render_task.cancel()
+            raise
+        with stage("mux") as record:
+            await run_ffmpeg(*await _mux_args(segments, [*AUDIO_INPUT_ARGS, '-i', str(audio_path)], final_video_path, audio_duration))
+            record["bytes"] = final_video_path.stat().st_size
+
+    if not final_video_path.exists():
+        raise Exception("FFmpeg отработал, но финальный видеофайл не был создан.")
+    await asyncio.to_thread(artifact_cache.put, final_key, ".mp4", final_video_path)
+
+    logger.info(f"Финальное видео создано: {final_video_path}; кэш: {artifact_cache.stats()}")
+    return final_video_path
+
+
+async def _stream_to_encoder(content: dict, resolution: tuple, profile: RenderProfile, tts_key: str, video_key: str,
+                             final_video_dir: Path, final_video_path: Path) -> None:
+    """Потоковый режим: TTS качается, пока идет рендер, и сразу подается в stdin склеивающего ffmpeg."""
+    logger.info("Генерация аудио (потоковый режим)...")
+    speech = _SpeechStream(content["tts_text"])
+    try:
+        segments = await _render_stage(content, resolution, profile, video_key, final_video_dir)
+        # Обычно озвучка успевает загрузиться за время рендера: тогда ее длина уже посчитана по фреймам
+        # и звук (aac) копируется без перекодирования. Если она еще качается, длина неизвестна,
+        # и звук перекодируется с дополнением тишиной до длины анимации
+        audio_duration = speech.duration
+        # В потоковом режиме в этот этап входит и ожидание оставшейся части озвучки
+        with stage("mux_stream") as record:
+            await run_ffmpeg(
+                *await _mux_args(segments, [*AUDIO_INPUT_ARGS, '-i', 'pipe:0'], final_video_path, audio_duration),
+                stdin_chunks=speech,
+            )
+            record["bytes"] = final_video_path.stat().st_size
+            record["tts_bytes"] = sum(map(len, speech.chunks))
+    except BaseException:
+        speech.task.cancel()
+        raise
+
+    # Озвучка уже в памяти: кладем ее в кэш одной записью, не перечитывая и не декодируя
+    await asyncio.to_thread(artifact_cache.put_bytes, tts_key, f".{TTS_FORMAT}", b"".join(speech.chunks))
+    if speech.duration_counter and speech.duration_counter.frames:
+        await asyncio.to_thread(artifact_cache.put_value, tts_key, speech.duration_counter.duration)
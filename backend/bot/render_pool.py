@@ -0,0 +1,221 @@
+# render_pool.py
+"""Пул долгоживущих процессов-рендереров Manim.
+
+Каждый воркер один раз импортирует animate_code (а вместе с ним manim, cairo и pango)
+и дальше получает задания по локальному каналу, поэтому на видео не тратится
+время на старт интерпретатора и импорты.
+"""
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import queue
+import resource
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Optional
+from highlight import DEFAULT_LANGUAGE
+
+logger = logging.getLogger(__name__)
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or os.cpu_count() or 1
+# Корень папок SVG-кэша Manim: у каждого воркера своя worker-<pid> (см. animate_code.worker_text_dir).
+# Каждое новое слово подписи добавляет в нее SVG, поэтому папка чистится, когда файлов становится слишком много
+MANIM_TEXT_DIR = os.getenv("MANIM_TEXT_DIR", "media/texts")
+MANIM_TEXT_DIR_MAX_FILES = int(os.getenv("MANIM_TEXT_DIR_MAX_FILES", "5000"))
+
+
+class RenderWorkerError(Exception):
+    """Воркер упал или вернул ошибку во время рендера."""
+
+
+@dataclass
+class RenderJob:
+    code_text: str
+    top_text: str
+    bottom_text: str
+    resolution: tuple  # (ширина, высота) в пикселях
+    frame_rate: int
+    media_dir: str  # собственная папка задания для всех файлов Manim
+    output_name: str  # имя итогового mp4 без расширения
+    caption_layer_path: str = ""  # если задан, подписи пишутся сюда PNG-слоем, а не рисуются в кадре
+    language: str = DEFAULT_LANGUAGE
+    tokens: Optional[list] = None  # подсветка кода из highlight.tokenize, чтобы рендерер не разбирал код сам
+
+
+@dataclass
+class _PendingJob:
+    job: RenderJob
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future = field(repr=False)
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True, name="manim-render-worker")
+        self.process.start()
+        child_conn.close()
+        self.job = None
+
+
+def _worker_main(conn):
+    # Тяжелые импорты делаются один раз; в forkserver модуль уже предзагружен
+    import animate_code
+    import scene_layout
+    text_dir = Path(animate_code.worker_text_dir())
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+            _trim_text_dir(text_dir)
+            try:
+                started, before = time.perf_counter(), resource.getrusage(resource.RUSAGE_SELF)
+                path = animate_code.render_code_scene(**job)
+                after = resource.getrusage(resource.RUSAGE_SELF)
+                usage = {
+                    "wall_s": time.perf_counter() - started,
+                    "cpu_s": after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime,
+                    "maxrss_kb": after.ru_maxrss,  # пик воркера за все время его жизни
+                }
+                conn.send(("ok", (path, usage, scene_layout.take_cache_files())))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        shutil.rmtree(text_dir, ignore_errors=True)
+
+
+def _trim_text_dir(text_dir: Path):
+    """Очищает SVG-кэш воркера, если он разросся; Manim пересоздаст нужные файлы."""
+    try:
+        with os.scandir(text_dir) as entries:
+            if sum(1 for _ in entries) <= MANIM_TEXT_DIR_MAX_FILES:
+                return
+    except OSError:
+        return
+    shutil.rmtree(text_dir, ignore_errors=True)
+
+
+def _remove_stale_text_dirs():
+    """Удаляет папки SVG-кэша воркеров, которые упали, не успев убрать за собой."""
+    for path in Path(MANIM_TEXT_DIR).glob("worker-*"):
+        try:
+            os.kill(int(path.name.split("-", 1)[1]), 0)
+        except ValueError:
+            continue
+        except ProcessLookupError:
+            shutil.rmtree(path, ignore_errors=True)
+        except PermissionError:
+            pass  # процесс жив, но чужой
+
+
+def _resolve(future: asyncio.Future, ok: bool, value):
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(RenderWorkerError(value))
+
+
+class RenderPool:
+    def __init__(self, size: int = RENDER_WORKERS):
+        self.size = size
+        self._ctx = mp.get_context("forkserver")
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._wakeup_r, self._wakeup_w = self._ctx.Pipe(duplex=False)
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        # Воркеры форкаются от сервера, в котором manim уже импортирован, поэтому и перезапуск дешевый
+        self._ctx.set_forkserver_preload(["animate_code"])
+        _remove_stale_text_dirs()
+        self._workers = [_Worker(self._ctx) for _ in range(self.size)]
+        self._thread = threading.Thread(target=self._supervise, name="render-pool", daemon=True)
+        self._thread.start()
+        logger.info(f"Пул рендереров запущен: {self.size} воркеров.")
+
+    async def render(self, job: RenderJob) -> str:
+        """Ставит задание в очередь пула и ждет путь к готовому mp4."""
+        path, _, _ = await self.render_with_usage(job)
+        return path
+
+    async def render_with_usage(self, job: RenderJob) -> tuple:
+        """То же, что render, плюс ресурсы воркера на задание (wall_s, cpu_s, maxrss_kb) и записанные им файлы кэша."""
+        loop = asyncio.get_running_loop()
+        pending = _PendingJob(job=job, loop=loop, future=loop.create_future())
+        self._jobs.put(pending)
+        self._wakeup_w.send_bytes(b"\0")
+        return await pending.future
+
+    def shutdown(self):
+        self._stopping = True
+        self._wakeup_w.send_bytes(b"\0")
+        if self._thread:
+            self._thread.join(timeout=5)
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+        logger.info("Пул рендереров остановлен.")
+
+    def _supervise(self):
+        while not self._stopping:
+            self._dispatch()
+            waitables = [self._wakeup_r]
+            for worker in self._workers:
+                waitables.append(worker.process.sentinel)
+                if worker.job is not None:
+                    waitables.append(worker.conn)
+            ready = wait(waitables)
+            if self._wakeup_r in ready:
+                while self._wakeup_r.poll():
+                    self._wakeup_r.recv_bytes()
+            for i, worker in enumerate(self._workers):
+                if worker.job is not None and worker.conn in ready:
+                    try:
+                        status, value = worker.conn.recv()
+                    except EOFError:
+                        status, value = None, None
+                    if status is not None:
+                        self._finish(worker, status == "ok", value)
+                if not worker.process.is_alive():
+                    self._workers[i] = self._restart(worker)
+
+    def _dispatch(self):
+        for worker in self._workers:
+            while worker.job is None:
+                try:
+                    pending = self._jobs.get_nowait()
+                except queue.Empty:
+                    return
+                if pending.future.cancelled():
+                    continue
+                worker.job = pending
+                worker.conn.send(asdict(pending.job))
+
+    def _finish(self, worker: _Worker, ok: bool, value):
+        pending, worker.job = worker.job, None
+        pending.loop.call_soon_threadsafe(_resolve, pending.future, ok, value)
+
+    def _restart(self, worker: _Worker) -> _Worker:
+        logger.error(f"Воркер рендера {worker.process.pid} завершился с кодом {worker.process.exitcode}, перезапускаю.")
+        if worker.job is not None:
+            self._finish(worker, False, f"Воркер рендера упал (код {worker.process.exitcode})")
+        worker.conn.close()
+        shutil.rmtree(Path(MANIM_TEXT_DIR) / f"worker-{worker.process.pid}", ignore_errors=True)
+        return _Worker(self._ctx)
@@ -0,0 +1,31 @@
+# render_profiles.py
+"""Профили рендера: разрешение, частота кадров и настройки кодировщика."""
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    name: str
+    title: str  # подпись на кнопке в боте
+    scale: float  # доля от полного разрешения формата
+    frame_rate: int
+    preset: str  # x264 preset для склейки в ffmpeg
+    crf: int
+    threads: int  # 0 — ffmpeg выбирает сам
+
+    def resolution(self, full_resolution: tuple) -> tuple:
+        # x264 с yuv420p требует четные размеры
+        width, height = full_resolution
+        return int(width * self.scale) // 2 * 2, int(height * self.scale) // 2 * 2
+
+    def encoder_args(self) -> list:
+        return ['-preset', self.preset, '-crf', str(self.crf), '-threads', str(self.threads)]
+
+
+PROFILES = {
+    # Быстрое превью, чтобы проверить раскладку: треть разрешения и 15 кадров/с
+    "draft": RenderProfile("draft", "Черновик", scale=1 / 3, frame_rate=15, preset="ultrafast", crf=32, threads=2),
+    "standard": RenderProfile("standard", "Стандарт", scale=1.0, frame_rate=30, preset="veryfast", crf=23, threads=0),
+    "high": RenderProfile("high", "Высокое качество", scale=1.0, frame_rate=60, preset="slow", crf=18, threads=0),
+}
+DEFAULT_PROFILE = PROFILES["standard"]
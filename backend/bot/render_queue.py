@@ -0,0 +1,206 @@
+# render_queue.py
+"""Глобальная очередь заданий на генерацию видео.
+
+Ограничивает число одновременных рендеров, отказывает в приеме при переполнении
+и раздает слоты по кругу между пользователями, чтобы один пользователь с пачкой
+заданий не занимал всю машину.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+from render_pool import RENDER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", "0")) or RENDER_WORKERS
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "20"))
+
+# Колбэк получает позицию в очереди (1, 2, ...) или 0, когда задание взято в работу
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    """Очередь переполнена, новое задание не принято."""
+
+
+@dataclass
+class _QueuedJob:
+    user_id: int
+    factory: Callable[[], Awaitable[Any]]
+    future: asyncio.Future = field(repr=False)
+    on_position: Optional[PositionCallback] = None
+    position: int = -1
+    started: bool = False
+    task: Optional[asyncio.Task] = field(default=None, repr=False)  # выполнение factory, когда задание взято в работу
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class RenderScheduler:
+    def __init__(self, concurrency: int = RENDER_CONCURRENCY, max_queued: int = RENDER_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self._queues = {}  # user_id -> deque[_QueuedJob]
+        self._order = deque()  # пользователи с ожидающими заданиями в порядке обхода
+        self._waiting = 0
+        self._running = 0
+        self._cond = None
+        self._workers = []
+        # Позиции рассылаются одной фоновой задачей, чтобы медленный Telegram не задерживал выдачу слотов
+        self._reporter = None
+        self._report_pending = False
+        self._started = []  # взятые в работу задания, которым еще не сообщили об этом
+        # Вызываются со временем ожидания задания в очереди (секунды), когда оно взято в работу
+        self.wait_listeners: List[Callable[[float], None]] = []
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    async def submit(self, user_id: int, factory: Callable[[], Awaitable[Any]], on_position: Optional[PositionCallback] = None) -> Any:
+        """Ставит задание в очередь и ждет его результат.
+
+        factory вызывается, когда до задания дошла очередь. Если очередь заполнена,
+        сразу выбрасывается QueueFullError. Отмена ожидания отменяет и уже начатое задание.
+        """
+        self._ensure_workers()
+        if self._waiting >= self.max_queued:
+            raise QueueFullError(f"Очередь заполнена ({self._waiting} заданий)")
+        job = _QueuedJob(user_id=user_id, factory=factory, future=asyncio.get_running_loop().create_future(), on_position=on_position)
+        async with self._cond:
+            if user_id not in self._queues:
+                self._queues[user_id] = deque()
+                self._order.append(user_id)
+            self._queues[user_id].append(job)
+            self._waiting += 1
+            self._cond.notify()
+        self._request_report()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            job.future.cancel()
+            if job.task:
+                # Задание уже выполняется: останавливаем его и ждем, чтобы вызывающий мог убрать его файлы
+                job.task.cancel()
+                await asyncio.wait([job.task])
+            raise
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        self._cond = asyncio.Condition()
+        self._spawn_workers()
+        logger.info(f"Очередь рендера запущена: {self.concurrency} параллельных заданий, до {self.max_queued} в ожидании.")
+
+    def _spawn_workers(self):
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def set_concurrency(self, concurrency: int) -> None:
+        """Меняет число одновременных заданий на ходу (например, по числу живых воркеров рендера).
+
+        Лишние обработчики при уменьшении не останавливаются, а ждут, пока число
+        выполняемых заданий опустится ниже нового предела.
+        """
+        concurrency = max(1, concurrency)
+        if concurrency == self.concurrency:
+            return
+        logger.info(f"Очередь рендера: {self.concurrency} -> {concurrency} параллельных заданий.")
+        self.concurrency = concurrency
+        if not self._workers:
+            return
+        async with self._cond:
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def _pop_next(self) -> _QueuedJob:
+        user_id = self._order.popleft()
+        user_queue = self._queues[user_id]
+        job = user_queue.popleft()
+        if user_queue:
+            # Пользователь уходит в конец круга, если у него остались задания
+            self._order.append(user_id)
+        else:
+            del self._queues[user_id]
+        self._waiting -= 1
+        return job
+
+    def _dispatch_order(self) -> list:
+        """Порядок, в котором ожидающие задания будут взяты в работу."""
+        queues = [list(self._queues[user_id]) for user_id in self._order]
+        ordered = []
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            ordered.extend(q[depth] for q in queues if depth < len(q))
+            depth += 1
+        return ordered
+
+    def _request_report(self, started: Optional[_QueuedJob] = None):
+        """Просит разослать позиции; запросы, пришедшие во время рассылки, сливаются в один проход."""
+        if started:
+            self._started.append(started)
+        self._report_pending = True
+        if self._reporter is None or self._reporter.done():
+            self._reporter = asyncio.create_task(self._report_positions())
+
+    async def _report_positions(self):
+        # Все уведомления идут из одной задачи, поэтому сообщения одного задания не обгоняют друг друга
+        while self._report_pending:
+            self._report_pending = False
+            updates = [(job, 0) for job in self._started]
+            self._started.clear()
+            updates += [(job, position) for position, job in enumerate(self._dispatch_order(), start=1)]
+            for job, position in updates:
+                # Задание могло стартовать, пока рассылались предыдущие позиции
+                if job.position == position or job.future.done() or (position and job.started):
+                    continue
+                job.position = position
+                await self._notify(job, position)
+
+    async def _notify(self, job: _QueuedJob, position: int):
+        if not job.on_position:
+            return
+        try:
+            await job.on_position(position)
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить позицию в очереди пользователю {job.user_id}: {e}")
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._waiting > 0 and self._running < self.concurrency)
+                job = self._pop_next()
+                if job.future.cancelled():
+                    continue
+                self._running += 1
+            job.started = True
+            waited = time.monotonic() - job.enqueued_at
+            for listener in self.wait_listeners:
+                listener(waited)
+            self._request_report(started=job)
+            job.task = asyncio.create_task(job.factory())
+            try:
+                result = await job.task
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # Задание отменил тот, кто ждал результат; обработчик берет следующее
+                if not job.future.done():
+                    job.future.cancel()
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                async with self._cond:
+                    self._running -= 1
+                    self._cond.notify()
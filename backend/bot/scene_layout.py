@@ -0,0 +1,203 @@
+# scene_layout.py
+"""Раскладка CodeScene и ее кэши.
+
+Построение кода и подписей (Pango, SVG, подгонка масштаба) — самая дорогая часть
+подготовки сцены. Готовые, уже отмасштабированные и расставленные объекты сериализуются
+и кэшируются по (код, язык, стиль, подписи, размер кадра), поэтому повтор запроса и смена
+качества пропускают всю эту работу. Отдельно кэшируются подписи, растеризованные в
+прозрачный PNG: их можно наложить в ffmpeg вместо отрисовки Cairo.
+
+Код собирается из готовых токенов (см. highlight) в Pango-разметку. Длинный код не
+ужимается до нечитаемого размера, а делится на страницы, которые показываются по очереди.
+"""
+import logging
+import pickle
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+from xml.sax.saxutils import escape
+import numpy as np
+from manim import Text, MarkupText, RoundedRectangle, VMobject, Camera, BOLD, WHITE
+from cache import ArtifactCache
+from highlight import CODE_STYLE, TokenLine, paginate, tokenize
+from text_measure import fit_text, wrap_text
+
+logger = logging.getLogger(__name__)
+
+# Сколько раскладок держать в памяти процесса в сериализованном виде
+MEMORY_LAYOUTS = 32
+CODE_FONT = "Monospace"
+CODE_FONT_SIZE = 24
+LINE_NUMBER_COLOR = "#888888"
+CODE_BACKGROUND = "#222222"
+CODE_BUFF = 0.3
+# Небольшое уменьшение по высоте лучше перелистывания; сильнее — уже делим на страницы
+MIN_HEIGHT_SHRINK = 0.75
+
+# Рендереры только читают и дописывают кэш; размер папки держит кэш конвейера в основном процессе
+_cache = ArtifactCache(evict=False)
+_memory = OrderedDict()  # ключ -> pickle SceneLayout
+
+
+@dataclass
+class SceneLayout:
+    background: VMobject  # подложка под код, одна на все страницы
+    pages: List[MarkupText]  # страницы кода, каждая на месте предыдущей
+    top: Optional[Text]
+    bottom: Optional[Text]
+    code_scale: float  # во сколько раз код уменьшен, чтобы поместиться между подписями
+
+
+def _code_markup(lines: List[TokenLine], first_line: int, number_width: int) -> str:
+    rows = []
+    for number, line in enumerate(lines, start=first_line):
+        spans = "".join(f'<span foreground="{color}">{escape(text)}</span>' for text, color in line)
+        rows.append(f'<span foreground="{LINE_NUMBER_COLOR}">{number:>{number_width}}</span>  {spans}')
+    return "\n".join(rows)
+
+
+def _code_text(lines: List[TokenLine], first_line: int, number_width: int) -> MarkupText:
+    return MarkupText(_code_markup(lines, first_line, number_width), font=CODE_FONT, font_size=CODE_FONT_SIZE)
+
+
+def _paginate_code(tokens: List[TokenLine], number_width: int, max_width: float, max_height: float) -> tuple:
+    """Страницы кода одного масштаба, каждая не выше max_height: [(номер первой строки, строк, текст)] и масштаб."""
+    full = _code_text(tokens, 1, number_width)
+    scale = min(1.0, max_width / full.width)
+    height_scale = max_height / full.height
+    if height_scale >= scale * MIN_HEIGHT_SHRINK:
+        scale = min(scale, height_scale)
+        return [(1, len(tokens), full.scale(scale))], scale
+
+    lines_per_page = max(1, int(len(tokens) * height_scale / scale))
+    while True:
+        pages = [(first, len(lines), _code_text(lines, first, number_width)) for first, lines in paginate(tokens, lines_per_page)]
+        if lines_per_page == 1 or all(text.height * scale <= max_height for _, _, text in pages):
+            break
+        lines_per_page -= 1
+    return [(first, count, text.scale(scale)) for first, count, text in pages], scale
+
+
+def build_layout(tokens: List[TokenLine], top_text: str, bottom_text: str, frame_width: float, frame_height: float) -> SceneLayout:
+    """Собирает и расставляет подписи и страницы кода в кадре frame_width x frame_height."""
+    top_text_mob = None
+    if top_text:
+        # Проверочный Text из fit_text уже собран с итоговой раскладкой, используем его же
+        _, top_text_mob = fit_text(top_text, frame_width * 0.95, font="Arial", weight=BOLD)
+        top_text_mob.scale_to_fit_width(frame_width * 0.95)
+        max_top_height = frame_height * 0.15
+        if top_text_mob.height > max_top_height:
+            top_text_mob.scale_to_fit_height(max_top_height)
+        # Центрируем по X, прижимаем к верху с небольшим отступом
+        top_text_mob.move_to([0, frame_height/2 - top_text_mob.height/2 - 0.2, 0])
+
+    bottom_text_mob = None
+    if bottom_text:
+        bottom_text_wrapped = wrap_text(bottom_text, frame_width * 0.95, font="Arial")
+        bottom_text_mob = Text(bottom_text_wrapped, font="Arial").scale(0.8)
+        bottom_text_mob.scale_to_fit_width(frame_width * 0.95)
+        max_bottom_height = frame_height * 0.15
+        if bottom_text_mob.height > max_bottom_height:
+            bottom_text_mob.scale_to_fit_height(max_bottom_height)
+        # Центрируем по X, прижимаем к низу с небольшим отступом
+        bottom_text_mob.move_to([0, -frame_height/2 + bottom_text_mob.height/2 + 0.2, 0])
+
+    # Определяем доступное пространство для кода между надписями
+    code_top_y = top_text_mob.get_bottom()[1] - 0.5 if top_text_mob else frame_height / 2 - 0.5
+    code_bottom_y = bottom_text_mob.get_top()[1] + 0.5 if bottom_text_mob else -frame_height / 2 + 0.5
+    available_height = code_top_y - code_bottom_y
+    available_width = frame_width * 0.9
+
+    number_width = len(str(max(len(tokens), 1)))
+    pages, code_scale = _paginate_code(tokens, number_width, available_width - 2 * CODE_BUFF, available_height - 2 * CODE_BUFF)
+    # Рамка текста начинается с первого видимого символа, поэтому страницам с более короткими
+    # номерами строк нужен отступ, чтобы колонка кода не прыгала при перелистывании
+    digits = MarkupText("0" * 8, font=CODE_FONT, font_size=CODE_FONT_SIZE)
+    advance = (digits.width - digits[0].width) / 7 * code_scale
+    indents = [(number_width - len(str(first + count - 1))) * advance for first, count, _ in pages]
+    box_width = max(indent + text.width for indent, (_, _, text) in zip(indents, pages))
+    box_height = max(text.height for _, _, text in pages)
+    center = np.array([0, code_bottom_y + available_height / 2, 0])
+    background = RoundedRectangle(
+        width=box_width + 2 * CODE_BUFF, height=box_height + 2 * CODE_BUFF, corner_radius=0.2,
+        fill_color=CODE_BACKGROUND, fill_opacity=1, stroke_color=WHITE, stroke_width=1,
+    ).move_to(center)
+
+    # Все страницы прижаты к левому верхнему углу подложки
+    left, top = center[0] - box_width / 2, center[1] + box_height / 2
+    for indent, (_, _, text) in zip(indents, pages):
+        text.shift(np.array([left + indent - text.get_left()[0], top - text.get_top()[1], 0]))
+    return SceneLayout(background=background, pages=[text for _, _, text in pages], top=top_text_mob, bottom=bottom_text_mob, code_scale=code_scale)
+
+
+def get_layout(code_str: str, language: str, top_text: str, bottom_text: str, frame_width: float, frame_height: float,
+               tokens: Optional[List[TokenLine]] = None) -> SceneLayout:
+    """Раскладка из кэша (память процесса, затем диск) или свежая.
+
+    tokens — готовая подсветка code_str (tokenize с CODE_STYLE); без них код разбирается здесь.
+    Всегда возвращается новая копия: анимации меняют объекты, а кэш должен остаться нетронутым.
+    """
+    key = _cache.key(
+        "layout", code=code_str, language=language, style=CODE_STYLE, top=top_text, bottom=bottom_text,
+        frame=(round(frame_width, 4), round(frame_height, 4)),
+    )
+    data = _memory.get(key)
+    if data is None:
+        data = _cache.get_bytes(key, ".pickle")
+    if data is not None:
+        try:
+            layout = pickle.loads(data)
+            _remember(key, data)
+            return layout
+        except Exception as e:
+            # Например, запись от другой версии manim: просто пересобираем
+            logger.warning(f"Не удалось загрузить раскладку из кэша, пересобираю: {e}")
+
+    if tokens is None:
+        tokens = tokenize(code_str, language)
+    layout = build_layout(tokens, top_text, bottom_text, frame_width, frame_height)
+    try:
+        data = pickle.dumps(layout, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logger.warning(f"Раскладку не удалось сериализовать, кэш пропущен: {e}")
+        return layout
+    _remember(key, data)
+    _cache.put_bytes(key, ".pickle", data)
+    return pickle.loads(data)
+
+
+def take_cache_files() -> List[str]:
+    """Раскладки и слои подписей, записанные в кэш с прошлого вызова: их размер учитывает владелец кэша."""
+    return _cache.take_written()
+
+
+def _remember(key: str, data: bytes):
+    _memory[key] = data
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_LAYOUTS:
+        _memory.popitem(last=False)
+
+
+def render_caption_layer(layout: SceneLayout, top_text: str, bottom_text: str, frame_width: float, frame_height: float,
+                         resolution: tuple, output_path: Path) -> Optional[Path]:
+    """Подписи в прозрачном PNG размера кадра для наложения в ffmpeg; None, если подписей нет."""
+    if not layout.top and not layout.bottom:
+        return None
+    key = _cache.key(
+        "captions", top=top_text, bottom=bottom_text, resolution=tuple(resolution),
+        frame=(round(frame_width, 4), round(frame_height, 4)),
+    )
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if _cache.get(key, ".png", output_path):
+        return output_path
+
+    pixel_width, pixel_height = resolution
+    camera = Camera(
+        pixel_width=pixel_width, pixel_height=pixel_height,
+        frame_width=frame_width, frame_height=frame_height, background_opacity=0,
+    )
+    camera.capture_mobjects([mob for mob in (layout.top, layout.bottom) if mob])
+    camera.get_image().save(output_path)
+    _cache.put(key, ".png", output_path)
+    return output_path
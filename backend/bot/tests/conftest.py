@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# Модули бота лежат плоско в backend/bot и импортируются по имени, как в Dockerfile
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,62 @@
+# tests/test_batch.py
+import asyncio
+from contextlib import aclosing
+import batch
+from batch import run_batch, submit_item
+from render_queue import RenderScheduler
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_items_wait_for_room_in_a_full_queue(monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_RETRY_MAX_SECONDS", 0.01)
+
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, max_queued=1)
+        gate = asyncio.Event()
+        # Очередь заняли задания другого пользователя
+        others = []
+        for _ in range(2):
+            others.append(asyncio.create_task(scheduler.submit(1, gate.wait)))
+            await asyncio.sleep(0)
+
+        async def render_item(index, content):
+            return await submit_item(scheduler, 2, lambda: asyncio.sleep(0, result=index))
+
+        results = run_batch([{}, {}, {}], render_item, concurrency=3)
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        done = [result async for result in results]
+        await asyncio.gather(*others)
+        return done
+
+    done = run(scenario())
+    assert sorted(result.video_path for result in done) == [1, 2, 3]
+    assert all(result.error is None for result in done)
+
+
+def test_closing_the_batch_stops_running_items():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=2)
+        stopped = []
+
+        async def render(index):
+            try:
+                if index == 1:
+                    return index
+                await asyncio.sleep(10)
+            finally:
+                stopped.append(index)
+
+        async def render_item(index, content):
+            return await submit_item(scheduler, 0, lambda: render(index))
+
+        async with aclosing(run_batch([{}, {}], render_item)) as results:
+            async for result in results:
+                assert result.video_path == 1
+                break
+        # Генератор закрыт: второй элемент уже остановлен, а не рендерится дальше
+        return stopped
+
+    assert sorted(run(scenario())) == [1, 2]
@@ -0,0 +1,84 @@
+# tests/test_broker.py
+import time
+from contextlib import closing
+import pytest
+import broker
+from broker import SqliteBroker
+
+
+@pytest.fixture
+def sqlite_broker(tmp_path):
+    return SqliteBroker(str(tmp_path / "broker.db"))
+
+
+def test_jobs_are_claimed_in_order(sqlite_broker):
+    first = sqlite_broker.enqueue({"n": 1})
+    second = sqlite_broker.enqueue({"n": 2})
+    assert sqlite_broker.claim("w1") == (first, {"n": 1})
+    assert sqlite_broker.claim("w1") == (second, {"n": 2})
+    assert sqlite_broker.claim("w1") is None
+
+
+def test_expired_lease_is_requeued(sqlite_broker):
+    job_id = sqlite_broker.enqueue({"n": 1})
+    assert sqlite_broker.claim("w1", lease_seconds=0.05)[0] == job_id
+    assert sqlite_broker.claim("w2") is None
+    time.sleep(0.1)
+    assert sqlite_broker.claim("w2") == (job_id, {"n": 1})
+    # Первый воркер потерял задание: продлить аренду и записать результат он уже не может
+    assert not sqlite_broker.heartbeat(job_id, "w1")
+    assert sqlite_broker.heartbeat(job_id, "w2")
+    sqlite_broker.complete(job_id, "w1", {"video_path": "stale.mp4"})
+    assert sqlite_broker.get_result(job_id) is None
+    sqlite_broker.complete(job_id, "w2", {"video_path": "final.mp4"})
+    assert sqlite_broker.get_result(job_id) == {"status": "done", "video_path": "final.mp4"}
+
+
+def test_job_fails_after_max_attempts(sqlite_broker, monkeypatch):
+    monkeypatch.setattr(broker, "RENDER_MAX_ATTEMPTS", 2)
+    job_id = sqlite_broker.enqueue({})
+    sqlite_broker.claim("w1", lease_seconds=0)
+    time.sleep(0.01)
+    sqlite_broker.claim("w2", lease_seconds=0)
+    time.sleep(0.01)
+    assert sqlite_broker.requeue_expired() == 1
+    assert sqlite_broker.get_result(job_id)["status"] == "failed"
+    assert sqlite_broker.claim("w3") is None
+
+
+def test_failure_and_cancel(sqlite_broker):
+    job_id = sqlite_broker.enqueue({})
+    sqlite_broker.claim("w1")
+    sqlite_broker.fail(job_id, "w1", "boom")
+    assert sqlite_broker.get_result(job_id) == {"status": "failed", "error": "boom"}
+
+    queued = sqlite_broker.enqueue({})
+    sqlite_broker.cancel(queued)
+    assert sqlite_broker.claim("w1") is None
+    assert sqlite_broker.get_result(queued)["status"] == "failed"
+
+
+def test_cancel_claimed_job_stops_worker(sqlite_broker):
+    job_id = sqlite_broker.enqueue({})
+    sqlite_broker.claim("w1")
+    sqlite_broker.cancel(job_id)
+    assert not sqlite_broker.heartbeat(job_id, "w1")
+    sqlite_broker.complete(job_id, "w1", {"video_path": "orphan.mp4"})
+    with closing(sqlite_broker._connect()) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+
+def test_capacity_counts_live_workers(sqlite_broker):
+    sqlite_broker.register_worker("w1", 2)
+    sqlite_broker.register_worker("w2", 3, ttl=0.05)
+    assert sqlite_broker.capacity() == 5
+    time.sleep(0.1)
+    assert sqlite_broker.capacity() == 2
+    sqlite_broker.unregister_worker("w1")
+    assert sqlite_broker.capacity() == 0
+
+
+def test_get_broker_by_url(tmp_path):
+    assert isinstance(broker.get_broker(f"sqlite:///{tmp_path}/b.db"), SqliteBroker)
+    with pytest.raises(ValueError):
+        broker.get_broker("amqp://localhost")
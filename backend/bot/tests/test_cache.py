@@ -0,0 +1,19 @@
+# tests/test_cache.py
+from cache import ArtifactCache
+
+
+def test_worker_writes_are_counted_and_evicted_by_owner(tmp_path):
+    owner = ArtifactCache(str(tmp_path), max_bytes=150)
+    worker = ArtifactCache(str(tmp_path), max_bytes=150, evict=False)
+    owner.put_bytes(owner.key("tts", n=1), ".mp3", b"a" * 100)
+    layout_key = worker.key("layout", n=1)
+    worker.put_bytes(layout_key, ".pickle", b"b" * 100)
+    # Воркер не вытесняет чужие записи, даже когда папка больше лимита
+    assert owner.get_bytes(owner.key("tts", n=1), ".mp3") is not None
+
+    owner.adopt(worker.take_written())
+    assert worker.take_written() == []
+    assert owner.stats()["bytes"] == 100
+    assert owner.get_bytes(owner.key("tts", n=1), ".mp3") is None
+    assert owner.get_bytes(layout_key, ".pickle") == b"b" * 100
+
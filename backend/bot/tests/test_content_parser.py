@@ -0,0 +1,34 @@
+# tests/test_content_parser.py
+from content_parser import parse_user_input, is_complete
+
+
+def test_code_without_tag_keeps_leading_letters():
+    content = parse_user_input("Присвоим значение ///x=2///")
+    assert content["code_text"] == "x=2"
+    assert content["language"] == "python"
+    assert content["tts_text"] == "Присвоим значение"
+
+
+def test_language_tag_on_its_own_line():
+    content = parse_user_input("Объявим переменную ///js\nlet a = 1;\n///")
+    assert content["code_text"] == "let a = 1;"
+    assert content["language"] == "javascript"
+
+
+def test_tag_alias_is_normalized():
+    assert parse_user_input("///py\nprint(1)///")["language"] == "python"
+
+
+def test_unknown_tag_is_first_line_of_code():
+    content = parse_user_input("Вызов ///foo\nbar()///")
+    assert content["code_text"] == "foo\nbar()"
+    assert content["language"] == "python"
+
+
+def test_captions_and_completeness():
+    content = parse_user_input("!!!Заголовок!!! Текст ///python\nprint(1)/// @@Подпись@@")
+    assert content["top_text"] == "Заголовок"
+    assert content["bottom_text"] == "Подпись"
+    assert content["tts_text"] == "Текст"
+    assert is_complete(content)
+    assert not is_complete(parse_user_input("только текст"))
@@ -0,0 +1,32 @@
+# tests/test_highlight.py
+from highlight import paginate, resolve_language, tokenize
+
+
+def test_resolve_language():
+    assert resolve_language("JS") == "javascript"
+    assert resolve_language("c++") == "cpp"
+    assert resolve_language("") is None
+    assert resolve_language("no-such-language") is None
+
+
+def test_tokenize_keeps_lines_and_text():
+    code = 'def f(x):\n    """a\n    b"""\n\n    return x'
+    lines = tokenize(code, "python")
+    assert len(lines) == 5
+    assert ["".join(text for text, _ in line) for line in lines] == code.split("\n")
+    # Многострочная строка разбита по строкам, но цвет у обеих частей один
+    assert lines[1][-1][1] == lines[2][0][1]
+    # Соседние токены одного цвета склеены
+    for line in lines:
+        assert all(a[1] != b[1] for a, b in zip(line, line[1:]))
+
+
+def test_tokenize_unknown_language_falls_back_to_python():
+    assert tokenize("x = 1", "no-such-language") == tokenize("x = 1", "python")
+
+
+def test_paginate_numbers_pages_from_first_line():
+    lines = [[[str(i), "#ffffff"]] for i in range(7)]
+    pages = paginate(lines, 3)
+    assert [(first, len(page)) for first, page in pages] == [(1, 3), (4, 3), (7, 1)]
+    assert paginate(lines, 0)[0] == (1, lines[:1])
@@ -0,0 +1,66 @@
+# tests/test_media_probe.py
+import pytest
+from media_probe import AdtsDurationCounter, Mp3DurationCounter, mp3_duration, parse_frame_header
+
+# MPEG-1 Layer III, 128 кбит/с, 44.1 кГц, без padding: фрейм 417 байт, 1152 сэмпла
+HEADER = bytes((0xFF, 0xFB, 0x90, 0xC4))
+FRAME = HEADER + bytes(417 - 4)
+FRAME_SECONDS = 1152 / 44100
+
+
+def id3_tag(payload_size: int) -> bytes:
+    size = bytes((payload_size >> 21 & 0x7F, payload_size >> 14 & 0x7F, payload_size >> 7 & 0x7F, payload_size & 0x7F))
+    # Внутри тега встречаются байты 0xFF: они не должны считаться фреймами
+    return b"ID3\x03\x00\x00" + size + b"\xff\xfb" * (payload_size // 2)
+
+
+def feed_in_chunks(data: bytes, chunk_size: int) -> Mp3DurationCounter:
+    counter = Mp3DurationCounter()
+    for start in range(0, len(data), chunk_size):
+        counter.feed(data[start:start + chunk_size])
+    return counter
+
+
+def test_parse_frame_header():
+    assert parse_frame_header(HEADER) == (417, 1152, 44100)
+    assert parse_frame_header(b"\x00\x00\x00\x00") is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 416, 418, 4096, 10 ** 6])
+def test_chunked_stream_with_id3(chunk_size):
+    data = id3_tag(1000) + FRAME * 100
+    counter = feed_in_chunks(data, chunk_size)
+    assert counter.frames == 100
+    assert counter.duration == pytest.approx(100 * FRAME_SECONDS)
+
+
+def test_xing_frame_is_not_counted_and_gives_frame_count(tmp_path):
+    # Служебный фрейм Info с флагом "число фреймов" и значением 250
+    info = HEADER + bytes(32) + b"Info" + b"\x00\x00\x00\x01" + (250).to_bytes(4, "big")
+    info += bytes(417 - len(info))
+    counter = feed_in_chunks(info + FRAME * 10, 100)
+    assert counter.frames == 10
+    assert counter.xing_frames == 250
+
+    path = tmp_path / "speech.mp3"
+    path.write_bytes(id3_tag(64) + info + FRAME * 10)
+    assert mp3_duration(path) == pytest.approx(250 * FRAME_SECONDS)
+
+
+def test_not_mp3(tmp_path):
+    path = tmp_path / "noise.mp3"
+    path.write_bytes(b"not an mp3 at all" * 100)
+    assert mp3_duration(path) is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 300, 10 ** 6])
+def test_adts_stream(chunk_size):
+    # AAC LC, 24 кГц (индекс 6), моно, фрейм 300 байт с одним блоком на 1024 сэмпла
+    length = 300
+    header = bytes((0xFF, 0xF1, 0x58, 0x40 | length >> 11, length >> 3 & 0xFF, (length & 0x07) << 5 | 0x1F, 0xFC))
+    data = b"\x00\xff" + (header + bytes(length - 7)) * 50
+    counter = AdtsDurationCounter()
+    for start in range(0, len(data), chunk_size):
+        counter.feed(data[start:start + chunk_size])
+    assert counter.frames == 50
+    assert counter.duration == pytest.approx(50 * 1024 / 24000)
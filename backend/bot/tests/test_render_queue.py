@@ -0,0 +1,97 @@
+# tests/test_render_queue.py
+import asyncio
+import pytest
+from render_queue import QueueFullError, RenderScheduler
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_round_robin_between_users():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, max_queued=20)
+        started = []
+        gate = asyncio.Event()
+
+        def job(name):
+            async def factory():
+                started.append(name)
+                await gate.wait()
+                return name
+            return factory
+
+        # Первое задание занимает единственный слот, остальные встают в очередь
+        tasks = [asyncio.create_task(scheduler.submit(0, job("blocker")))]
+        await asyncio.sleep(0)
+        for user, count in (("a", 3), ("b", 2), ("c", 1)):
+            for i in range(count):
+                tasks.append(asyncio.create_task(scheduler.submit(user, job(f"{user}{i}"))))
+        await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return started
+
+    assert run(scenario()) == ["blocker", "a0", "b0", "c0", "a1", "b1", "a2"]
+
+
+def test_positions_are_reported_without_blocking_dispatch():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1)
+        positions = {}
+
+        def report(index):
+            async def on_position(position):
+                positions.setdefault(index, []).append(position)
+                await asyncio.sleep(0.2)  # медленный Telegram
+            return on_position
+
+        async def job():
+            await asyncio.sleep(0.01)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.gather(*(scheduler.submit(i, job, on_position=report(i)) for i in range(8)))
+        return loop.time() - started, positions
+
+    elapsed, positions = run(scenario())
+    assert elapsed < 0.5
+    assert positions[0] == [0]
+
+
+def test_queue_full():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1, max_queued=1)
+        gate = asyncio.Event()
+        blocker = asyncio.create_task(scheduler.submit(0, gate.wait))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.submit(0, gate.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(1, gate.wait)
+        gate.set()
+        await asyncio.gather(blocker, queued)
+
+    run(scenario())
+
+
+def test_set_concurrency_raises_and_lowers_limit():
+    async def scenario():
+        scheduler = RenderScheduler(concurrency=1)
+        running = peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+        await scheduler.set_concurrency(3)
+        await asyncio.gather(*(scheduler.submit(i, job) for i in range(9)))
+        raised_peak, peak = peak, 0
+        await scheduler.set_concurrency(2)
+        await asyncio.gather(*(scheduler.submit(i, job) for i in range(9)))
+        return raised_peak, peak
+
+    assert run(scenario()) == (3, 2)
@@ -0,0 +1,66 @@
+# text_measure.py
+"""Измерение и перенос текста для подписей без сборки Text на каждое слово.
+
+Ширина каждого слова и пробела измеряется один раз на (шрифт, начертание) и кэшируется
+на все время жизни процесса (воркеры рендера живут долго). Ширина строки считается
+суммой, а полноценный Text собирается только один раз — для проверки итоговой раскладки.
+"""
+from functools import lru_cache
+from typing import List, Tuple
+from manim import Text, BOLD
+
+# Сколько раз можно пересобрать раскладку, если приближенная ширина разошлась с реальной
+MAX_REFITS = 2
+
+
+@lru_cache(maxsize=8192)
+def word_width(word: str, font: str, weight) -> float:
+    return Text(word, font=font, weight=weight).width
+
+
+@lru_cache(maxsize=64)
+def space_width(font: str, weight) -> float:
+    # Text не рисует пробелы, поэтому ширину пробела получаем как разницу
+    return Text("x x", font=font, weight=weight).width - 2 * word_width("x", font, weight)
+
+
+def wrap_words(words: List[str], max_width: float, font: str, weight) -> List[str]:
+    """Жадный перенос по сумме кэшированных ширин слов."""
+    space = space_width(font, weight)
+    lines: List[str] = []
+    current: List[str] = []
+    current_width = 0.0
+    for word in words:
+        width = word_width(word, font, weight)
+        candidate = current_width + space + width if current else width
+        if candidate <= max_width or not current:
+            current.append(word)
+            current_width = candidate
+        else:
+            lines.append(" ".join(current))
+            current, current_width = [word], width
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+def fit_text(text: str, max_width: float, font: str = "Arial", weight=BOLD) -> Tuple[str, Text]:
+    """Переносит text по ширине max_width и возвращает строки вместе с проверочным Text.
+
+    Сумма ширин не учитывает кернинг, поэтому итоговая раскладка проверяется одним
+    настоящим Text; если она шире допустимого, ширина уменьшается пропорционально.
+    """
+    words = text.split()
+    limit = max_width
+    for _ in range(MAX_REFITS + 1):
+        lines = wrap_words(words, limit, font, weight)
+        wrapped = "\n".join(lines)
+        mob = Text(wrapped, font=font, weight=weight)
+        if mob.width <= max_width or len(lines) == len(words):
+            break
+        limit *= max_width / mob.width
+    return wrapped, mob
+
+
+def wrap_text(text: str, max_width: float, font: str = "Arial", weight=BOLD) -> str:
+    return fit_text(text, max_width, font=font, weight=weight)[0]
@@ -0,0 +1,106 @@
+# worker.py
+"""Воркер рендера: забирает задания из брокера и создает видео в общем хранилище.
+
+Запускается тем же образом, что и бот (python worker.py); реплик может быть сколько угодно.
+Пока задание рендерится, воркер продлевает его аренду. Если воркер упал или завис,
+аренда истекает, и задание забирает другой воркер.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+from pathlib import Path
+from broker import get_broker, RENDER_LEASE_SECONDS
+from pipeline import generate_video, open_artifact_cache, render_pool, current_job
+from render_pool import RENDER_WORKERS
+from render_profiles import PROFILES
+
+logger = logging.getLogger(__name__)
+
+# Сколько заданий воркер ведет одновременно; рендер все равно ограничен пулом
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "0")) or RENDER_WORKERS
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1"))
+HEARTBEAT_INTERVAL = RENDER_LEASE_SECONDS / 3
+
+
+async def run_job(broker, worker_id: str, job_id: str, payload: dict) -> None:
+    current_job.set(job_id)
+    job_dir = Path(payload["final_video_dir"])
+    job_dir.mkdir(parents=True, exist_ok=True)
+    render_task = asyncio.create_task(generate_video(
+        payload["content"], payload["chosen_format"], job_dir, PROFILES[payload["profile"]],
+    ))
+    try:
+        while not render_task.done():
+            await asyncio.wait([render_task], timeout=HEARTBEAT_INTERVAL)
+            if not render_task.done() and not await asyncio.to_thread(broker.heartbeat, job_id, worker_id):
+                # Аренда потеряна (например, воркер долго стоял) — задание уже у другого воркера,
+                # либо бот отменил задание, и результат никто не ждет
+                logger.warning(f"Аренда задания {job_id} потеряна или задание отменено, прекращаю рендер.")
+                render_task.cancel()
+                return
+        video_path = render_task.result()
+    except asyncio.CancelledError:
+        render_task.cancel()
+        raise
+    except Exception as e:
+        logger.error(f"Задание {job_id} не удалось: {e}", exc_info=True)
+        await asyncio.to_thread(broker.fail, job_id, worker_id, str(e))
+        return
+    await asyncio.to_thread(broker.complete, job_id, worker_id, {"video_path": str(video_path)})
+    logger.info(f"Задание {job_id} готово: {video_path}")
+
+
+async def advertise(broker, worker_id: str) -> None:
+    """Сообщает брокеру, что воркер жив и сколько у него слотов: по сумме слотов бот решает, сколько заданий отдавать."""
+    while True:
+        try:
+            await asyncio.to_thread(broker.register_worker, worker_id, WORKER_CONCURRENCY)
+        except Exception as e:
+            logger.warning(f"Не удалось отметиться в брокере: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def work_slot(broker, worker_id: str, stopping: asyncio.Event) -> None:
+    while not stopping.is_set():
+        claimed = await asyncio.to_thread(broker.claim, worker_id)
+        if claimed is None:
+            try:
+                await asyncio.wait_for(stopping.wait(), WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(broker, worker_id, *claimed)
+
+
+async def _main() -> None:
+    broker = get_broker()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        # Начатые задания доделываются, новые не берутся
+        loop.add_signal_handler(sig, stopping.set)
+
+    open_artifact_cache()
+    render_pool.start()
+    advertising = asyncio.create_task(advertise(broker, worker_id))
+    logger.info(f"Воркер {worker_id} запущен: {WORKER_CONCURRENCY} заданий одновременно.")
+    try:
+        await asyncio.gather(*(work_slot(broker, worker_id, stopping) for _ in range(WORKER_CONCURRENCY)))
+    finally:
+        advertising.cancel()
+        await asyncio.to_thread(broker.unregister_worker, worker_id)
+        render_pool.shutdown()
+    logger.info(f"Воркер {worker_id} остановлен.")
+
+
+def main() -> None:
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+    os.makedirs("static/videos", exist_ok=True)
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 # youtube_client.py (версия для "ручной" авторизации)
+import datetime
 import os
 import pickle
+import threading
+import httplib2
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
@@ -10,11 +14,20 @@ from googleapiclient.http import MediaFileUpload
 CLIENT_SECRETS_FILE = '/data/client_secrets.json'
 TOKEN_PICKLE_FILE = '/data/token.pickle'
 YOUTUBE_SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
+# Размер куска resumable-загрузки; API требует кратность 256 КБ
+YOUTUBE_CHUNK_SIZE = int(os.getenv("YOUTUBE_CHUNK_MB", "8")) * 1024 * 1024
+# Токен обновляется заранее, если до его истечения осталось меньше этого
+TOKEN_REFRESH_MARGIN = datetime.timedelta(seconds=int(os.getenv("YOUTUBE_TOKEN_REFRESH_MARGIN", "300")))
 
 class YouTubeClient:
+    """Учетные данные общие, а сервис API у каждого потока свой: httplib2.Http не потокобезопасен."""
+
     def __init__(self):
+        # Обновление и запись токена из нескольких потоков загрузки идут по очереди
+        self._creds_lock = threading.RLock()
+        self._local = threading.local()
+        self._generation = 0  # растет при смене учетных данных, чтобы потоки пересобрали свои сервисы
         self.creds = self._load_credentials()
-        self.youtube_service = self._build_service()
         self.flow = None # Для хранения состояния между шагами авторизации
 
     def _load_credentials(self):
@@ -24,12 +37,41 @@ class YouTubeClient:
                 creds = pickle.load(token)
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+            self._save_credentials(creds)
         return creds
 
-    def _build_service(self):
-        if self.creds and self.creds.valid:
-            return build('youtube', 'v3', credentials=self.creds)
-        return None
+    @staticmethod
+    def _save_credentials(creds):
+        tmp_path = f"{TOKEN_PICKLE_FILE}.tmp"
+        with open(tmp_path, 'wb') as token:
+            pickle.dump(creds, token)
+        os.replace(tmp_path, TOKEN_PICKLE_FILE)
+
+    def refresh_if_expiring(self) -> None:
+        """Обновляет токен до истечения, чтобы загрузка не упиралась в 401 посреди файла."""
+        if not self.creds or not self.creds.refresh_token:
+            return
+        expiry = self.creds.expiry  # наивное время в UTC
+        with self._creds_lock:
+            # Пока ждали блокировку, токен мог обновить другой поток
+            expiry = self.creds.expiry
+            if expiry is None or expiry - datetime.datetime.utcnow() > TOKEN_REFRESH_MARGIN:
+                return
+            self.creds.refresh(Request())
+            self._save_credentials(self.creds)
+
+    @property
+    def youtube_service(self):
+        """Сервис API текущего потока: свой AuthorizedHttp поверх общих учетных данных."""
+        with self._creds_lock:
+            if not (self.creds and self.creds.valid):
+                return None
+            creds, generation = self.creds, self._generation
+        if getattr(self._local, "generation", None) != generation:
+            http = AuthorizedHttp(creds, http=httplib2.Http())
+            self._local.service = build('youtube', 'v3', http=http)
+            self._local.generation = generation
+        return self._local.service
 
     def initiate_authorization(self):
         """Начинает процесс ручной авторизации и возвращает URL."""
@@ -46,10 +88,10 @@ class YouTubeClient:
             # Указываем localhost, так как это Desktop App Flow
             self.flow.redirect_uri = "http://localhost"
             self.flow.fetch_token(authorization_response=pasted_url)
-            self.creds = self.flow.credentials
-            with open(TOKEN_PICKLE_FILE, 'wb') as token:
-                pickle.dump(self.creds, token)
-            self.youtube_service = self._build_service()
+            with self._creds_lock:
+                self.creds = self.flow.credentials
+                self._save_credentials(self.creds)
+                self._generation += 1
             return True
         except Exception as e:
             print(f"Ошибка при завершении авторизации: {e}")
@@ -58,21 +100,35 @@ class YouTubeClient:
     def is_authorized(self):
         return self.creds and self.creds.valid
 
-    def upload_video(self, file_path, title, description, tags, privacy_status="public"):
-        if not self.is_authorized() or not self.youtube_service:
+    def upload_video(self, file_path, title, description, tags, privacy_status="public", session=None, on_progress=None):
+        """Загружает видео кусками по YOUTUBE_CHUNK_SIZE.
+
+        session (см. youtube_uploader.UploadSession) хранит URI загрузки и подтвержденное
+        сервером смещение: повторный вызов с той же сессией продолжает с этого места.
+        on_progress получает долю загруженного от 0 до 1.
+        """
+        self.refresh_if_expiring()
+        youtube_service = self.youtube_service
+        if not youtube_service:
             raise Exception("Клиент YouTube не авторизован.")
 
         body = {
             'snippet': { 'title': title, 'description': description, 'tags': tags, 'categoryId': '22' },
             'status': { 'privacyStatus': privacy_status }
         }
-        media = MediaFileUpload(file_path, chunksize=-1, resumable=True)
-        request = self.youtube_service.videos().insert(part=",".join(body.keys()), body=body, media_body=media)
+        media = MediaFileUpload(file_path, chunksize=YOUTUBE_CHUNK_SIZE, resumable=True)
+        request = youtube_service.videos().insert(part=",".join(body.keys()), body=body, media_body=media)
+        if session and session.resumable_uri:
+            request.resumable_uri = session.resumable_uri
+            request.resumable_progress = session.progress
 
         response = None
         while response is None:
+            self.refresh_if_expiring()
             status, response = request.next_chunk()
-            if status:
-                print(f"Загружено {int(status.progress() * 100)}%")
+            if session:
+                session.update(request.resumable_uri, request.resumable_progress)
+            if status and on_progress:
+                on_progress(status.progress())
 
         return response
\ No newline at end of file
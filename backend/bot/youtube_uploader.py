@@ -0,0 +1,199 @@
+# youtube_uploader.py
+"""Фоновые загрузки на YouTube: общий клиент, повторы с паузами и продолжение с места обрыва.
+
+Один авторизованный YouTubeClient живет все время работы бота: токен не перечитывается
+с диска и сервис discovery не пересобирается на каждую загрузку. Загрузки идут в
+ограниченном пуле потоков. Сессия каждой загрузки (URI resumable-загрузки и подтвержденное
+смещение) сохраняется на диск после каждого куска, поэтому после обрыва связи или
+перезапуска бота файл догружается, а не отправляется заново.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+import httplib2
+from googleapiclient.errors import HttpError
+from youtube_client import YouTubeClient
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_UPLOAD_WORKERS = int(os.getenv("YOUTUBE_UPLOAD_WORKERS", "2"))
+YOUTUBE_MAX_RETRIES = int(os.getenv("YOUTUBE_MAX_RETRIES", "8"))
+UPLOAD_SESSIONS_DIR = os.getenv("UPLOAD_SESSIONS_DIR", "/data/uploads")
+# URI resumable-загрузки живет около недели; более старые сессии начинаются заново
+SESSION_MAX_AGE = 6 * 24 * 3600
+_RETRIABLE_STATUSES = {429, 500, 502, 503, 504}
+# Сервер забыл загрузку: начинаем с нуля с новым URI
+_EXPIRED_SESSION_STATUSES = {404, 410}
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+# Прогресс в чат сообщается с таким шагом, чтобы не упираться в лимиты Telegram
+PROGRESS_STEP = 0.1
+
+ProgressCallback = Callable[[float], Awaitable[None]]
+
+
+class YouTubeAuthError(Exception):
+    """Авторизация YouTube не пройдена."""
+
+
+@dataclass
+class UploadSession:
+    key: str
+    chat_id: int
+    file_path: str
+    title: str
+    description: str
+    tags: list = field(default_factory=list)
+    privacy_status: str = "private"
+    resumable_uri: str = ""
+    progress: int = 0  # байт, подтвержденных сервером
+    created_at: float = field(default_factory=time.time)
+    sessions_dir: str = field(default=UPLOAD_SESSIONS_DIR, repr=False)
+
+    @property
+    def path(self) -> Path:
+        return Path(self.sessions_dir) / f"{self.key}.json"
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = asdict(self)
+        del data["sessions_dir"]
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def update(self, resumable_uri: Optional[str], progress: int) -> None:
+        """Вызывается YouTubeClient после каждого куска."""
+        resumable_uri = resumable_uri or ""
+        if resumable_uri != self.resumable_uri or progress != self.progress:
+            self.resumable_uri, self.progress = resumable_uri, progress
+            self.save()
+
+    def restart(self) -> None:
+        self.update("", 0)
+        self.created_at = time.time()
+
+    def delete(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: Path) -> "UploadSession":
+        return cls(**json.loads(path.read_text(encoding="utf-8")), sessions_dir=str(path.parent))
+
+
+def _backoff(attempt: int) -> float:
+    # Экспоненциальная пауза со случайным разбросом, чтобы повторы не шли залпом
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class YouTubeUploader:
+    def __init__(self, workers: int = YOUTUBE_UPLOAD_WORKERS, sessions_dir: str = UPLOAD_SESSIONS_DIR,
+                 client_factory: Callable[[], YouTubeClient] = YouTubeClient):
+        self.sessions_dir = sessions_dir
+        self._client_factory = client_factory
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="youtube-upload")
+
+    def client(self) -> YouTubeClient:
+        """Общий клиент (блокирующий вызов: при первом обращении читает токен и строит сервис)."""
+        with self._client_lock:
+            if self._client is None:
+                self._client = self._client_factory()
+            self._client.refresh_if_expiring()
+            return self._client
+
+    async def get_client(self) -> YouTubeClient:
+        # Не в пуле загрузок: его потоки могут быть заняты загрузками и паузами между повторами
+        return await asyncio.to_thread(self.client)
+
+    def new_session(self, chat_id: int, file_path, title: str, description: str, tags: list = None,
+                    privacy_status: str = "private") -> UploadSession:
+        session = UploadSession(
+            key=uuid.uuid4().hex, chat_id=chat_id, file_path=str(file_path), title=title, description=description,
+            tags=tags or [], privacy_status=privacy_status, sessions_dir=self.sessions_dir,
+        )
+        session.save()
+        return session
+
+    def pending_sessions(self) -> List[UploadSession]:
+        """Незавершенные загрузки, оставшиеся от прошлого запуска; сессии без файла удаляются."""
+        sessions = []
+        for path in sorted(Path(self.sessions_dir).glob("*.json")):
+            try:
+                session = UploadSession.load(path)
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Не удалось прочитать сессию загрузки {path}: {e}")
+                path.unlink(missing_ok=True)
+                continue
+            if Path(session.file_path).exists():
+                sessions.append(session)
+            else:
+                session.delete()
+        return sessions
+
+    async def upload(self, session: UploadSession, on_progress: Optional[ProgressCallback] = None) -> dict:
+        """Загружает файл сессии в пуле потоков и возвращает ответ API (с id видео)."""
+        loop = asyncio.get_running_loop()
+        reported = [-1.0]
+
+        def report(fraction: float) -> None:
+            if on_progress and fraction - reported[0] >= PROGRESS_STEP:
+                reported[0] = fraction
+                asyncio.run_coroutine_threadsafe(on_progress(fraction), loop)
+
+        return await loop.run_in_executor(self._executor, self._upload_with_retries, session, report)
+
+    def _upload_with_retries(self, session: UploadSession, report: Callable[[float], None]) -> dict:
+        if session.resumable_uri and time.time() - session.created_at > SESSION_MAX_AGE:
+            session.restart()
+        attempt = 0
+        while True:
+            try:
+                client = self.client()
+                if not client.is_authorized():
+                    raise YouTubeAuthError("Авторизация YouTube не найдена. Выполните /youtube_auth.")
+                response = client.upload_video(
+                    file_path=session.file_path, title=session.title, description=session.description,
+                    tags=session.tags, privacy_status=session.privacy_status, session=session, on_progress=report,
+                )
+                session.delete()
+                return response
+            except HttpError as e:
+                status = e.resp.status
+                if status in _EXPIRED_SESSION_STATUSES and session.resumable_uri:
+                    logger.warning(f"Сессия загрузки {session.key} истекла на сервере, начинаю заново.")
+                    session.restart()
+                elif status not in _RETRIABLE_STATUSES:
+                    session.delete()
+                    raise
+                error = e
+            except (OSError, httplib2.HttpLib2Error) as e:
+                # Обрыв соединения или таймаут: продолжим с подтвержденного смещения
+                error = e
+            except Exception:
+                session.delete()
+                raise
+            if attempt >= YOUTUBE_MAX_RETRIES:
+                session.delete()
+                raise error
+            delay = _backoff(attempt)
+            attempt += 1
+            logger.warning(
+                f"Загрузка {session.key} прервалась на {session.progress} байт ({error}), "
+                f"повтор {attempt}/{YOUTUBE_MAX_RETRIES} через {delay:.1f} с."
+            )
+            time.sleep(delay)
+
+    def shutdown(self) -> None:
+        # Незавершенные загрузки остаются на диске и продолжатся при следующем запуске
+        self._executor.shutdown(wait=False, cancel_futures=True)